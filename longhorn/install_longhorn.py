@@ -4,10 +4,336 @@ import os
 import yaml
 import re
 import argparse
+import sys
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+
+HELM_VERSION = "v3.11.2"
+LONGHORN_REPO = "https://charts.longhorn.io"
+DEFAULT_CACHE_DIR = "/var/cache/longhorn-install"
+VALUES_FILE = "/tmp/longhorn-values.yaml"
+# kubeconfig context kubectl and helm act on, None for the current one
+KUBE_CONTEXT = None
+
+
+# name of the step the current thread runs, see run_steps
+_step = threading.local()
+
+
+class _stepOutput(object):
+    """
+    sys.stdout while steps run: every line a step prints gets the step name
+    as prefix, so the output of concurrent steps stays readable
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        name = getattr(_step, 'name', None)
+        if name is None:
+            return self.stream.write(text)
+        *lines, _step.buffer = (_step.buffer + text).split("\n")
+        with self._lock:
+            for line in lines:
+                self.stream.write(f"[{name}] {line}\n")
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def run_command(command, check=False):
+    """
+    subprocess.run without captured output; inside a step the output is read
+    line by line and printed, so it gets the step prefix
+    """
+    if getattr(_step, 'name', None) is None:
+        return subprocess.run(command, check=check)
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True) as process:
+        for line in process.stdout:
+            print(line.rstrip("\n"))
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return subprocess.CompletedProcess(command, process.returncode)
+
+
+def kubectl(*args):
+    return ["kubectl"] + (["--context", KUBE_CONTEXT] if KUBE_CONTEXT else []) + list(args)
+
+
+def helm_kube(*args):
+    return ["helm"] + list(args) + (["--kube-context", KUBE_CONTEXT] if KUBE_CONTEXT else [])
+
+
+class artifactCache(object):
+    """
+    Local store of downloaded artifacts. index.json keeps the sha256 of every
+    file, a file is only used when it still matches, so a torn download or a
+    corrupted disk never gets installed. In offline mode nothing is fetched
+    and a missing artifact is an error.
+    """
+
+    def __init__(self, cache_dir, offline=False):
+        self.cache_dir = cache_dir
+        self.offline = offline
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.index = {}
+        # steps fetch concurrently, the index is shared between them
+        self._lock = threading.Lock()
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r') as file:
+                self.index = json.load(file)
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _save_index(self):
+        """
+        Write the index atomically, called with the lock held
+        """
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, prefix=".index-")
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(self.index, file, indent=2)
+            os.replace(tmp_file, self.index_file)
+        except Exception:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    def get(self, name):
+        """
+        Path of the cached artifact when present and intact, None otherwise
+        """
+        file_path = self.path(name)
+        with self._lock:
+            digest = self.index.get(name)
+        if digest is None or not os.path.exists(file_path):
+            return None
+        if sha256sum(file_path) != digest:
+            print(f"Cached {name} does not match its checksum, discarding it")
+            with self._lock:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                self.index.pop(name, None)
+                self._save_index()
+            return None
+        return file_path
+
+    def put(self, name, src_path, expected_sha256=None):
+        """
+        Move a downloaded file into the cache, verifying it against expected_sha256
+        """
+        digest = sha256sum(src_path)
+        if expected_sha256 and digest != expected_sha256:
+            os.remove(src_path)
+            raise ValueError(f"checksum mismatch for {name}: expected {expected_sha256}, got {digest}")
+        with self._lock:
+            os.replace(src_path, self.path(name))
+            self.index[name] = digest
+            self._save_index()
+        return self.path(name)
+
+    def fetch(self, name, url, expected_sha256=None, insecure=False, refresh=False):
+        """
+        Cached artifact for url, downloaded on a miss unless offline
+        """
+        file_path = None if refresh and not self.offline else self.get(name)
+        if file_path:
+            print(f"Using cached {name}")
+            return file_path
+        if self.offline:
+            raise FileNotFoundError(f"{name} is not in the cache {self.cache_dir} (offline mode)")
+        print(f"Downloading {url}...")
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".download-")
+        os.close(fd)
+        try:
+            download(url, tmp_path, insecure)
+            return self.put(name, tmp_path, expected_sha256)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def sha256sum(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download(url, file_path, insecure=False, timeout=60):
+    import ssl
+    import urllib.request
+    context = ssl._create_unverified_context() if insecure else None
+    with urllib.request.urlopen(url, timeout=timeout, context=context) as response, \
+            open(file_path, 'wb') as file:
+        shutil.copyfileobj(response, file, 1024 * 1024)
+
+K3S_KUBECONFIG = "/etc/rancher/k3s/k3s.yaml"
+CONTROL_PLANE_LABELS = ("node-role.kubernetes.io/control-plane", "node-role.kubernetes.io/master")
+SIOCGIFADDR = 0x8915
+
+
+def kubeconfig_path():
+    for file_path in (os.environ.get("KUBECONFIG", "").split(os.pathsep)[0], K3S_KUBECONFIG,
+                      os.path.expanduser("~/.kube/config")):
+        if file_path and os.path.exists(file_path):
+            return file_path
+    return None
+
+def _kubeconfig_data(entry, key):
+    """
+    Bytes of <key>-data, or of the file <key> points to
+    """
+    import base64
+    if entry.get(f"{key}-data"):
+        return base64.b64decode(entry[f"{key}-data"])
+    if entry.get(key):
+        with open(entry[key], 'rb') as file:
+            return file.read()
+    return None
+
+def kube_api(path, timeout=10):
+    """
+    GET path from the API server of the kubeconfig (current context or KUBE_CONTEXT)
+    without forking kubectl, returns the decoded JSON
+    """
+    import ssl
+    import urllib.request
+
+    file_path = kubeconfig_path()
+    if file_path is None:
+        raise FileNotFoundError("no kubeconfig found")
+    with open(file_path, 'r') as file:
+        config = yaml.safe_load(file)
+    context_name = KUBE_CONTEXT or config.get('current-context')
+    context = next(item['context'] for item in config['contexts'] if item['name'] == context_name)
+    cluster = next(item['cluster'] for item in config['clusters'] if item['name'] == context['cluster'])
+    user = next((item['user'] for item in config.get('users') or [] if item['name'] == context.get('user')), {})
+
+    ssl_context = ssl.create_default_context()
+    ca_data = _kubeconfig_data(cluster, 'certificate-authority')
+    if cluster.get('insecure-skip-tls-verify'):
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    elif ca_data:
+        ssl_context.load_verify_locations(cadata=ca_data.decode())
+    cert_data = _kubeconfig_data(user, 'client-certificate')
+    key_data = _kubeconfig_data(user, 'client-key')
+    if cert_data and key_data:
+        # ssl only loads client certificates from files, they live just as long as this call
+        with tempfile.TemporaryDirectory() as cert_dir:
+            cert_file = os.path.join(cert_dir, "client.crt")
+            key_file = os.path.join(cert_dir, "client.key")
+            for name, data in ((cert_file, cert_data), (key_file, key_data)):
+                fd = os.open(name, os.O_WRONLY | os.O_CREAT, 0o600)
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(data)
+            ssl_context.load_cert_chain(cert_file, key_file)
+
+    request = urllib.request.Request(cluster['server'].rstrip("/") + path, headers={'Accept': "application/json"})
+    if user.get('token'):
+        request.add_header("Authorization", f"Bearer {user['token']}")
+    elif user.get('username'):
+        import base64
+        credentials = base64.b64encode(f"{user['username']}:{user.get('password', '')}".encode()).decode()
+        request.add_header("Authorization", f"Basic {credentials}")
+    with urllib.request.urlopen(request, timeout=timeout, context=ssl_context) as response:
+        return json.load(response)
 
 def get_kubernetes_master_ip():
+    """
+    InternalIP of the first control-plane node, read from the API server.
+    Falls back to kubectl when the kubeconfig cannot be used directly.
+    """
+    try:
+        nodes = kube_api("/api/v1/nodes")['items']
+    except Exception as e:
+        print(f"Kubernetes API not usable directly ({e}), using kubectl")
+        return _kubectl_master_ip()
+
+    for node in nodes:
+        labels = node['metadata'].get('labels') or {}
+        if any(label in labels for label in CONTROL_PLANE_LABELS):
+            for address in node['status'].get('addresses') or []:
+                if address['type'] == "InternalIP":
+                    return address['address']
+
+    print("No master node found.")
+    return None
+
+def _fib_trie_local_ips(file_path="/proc/net/fib_trie"):
+    """
+    IPv4 addresses of the local interfaces from the kernel routing trie,
+    every "/32 host LOCAL" leaf is an address of this host
+    """
+    local_ips = []
+    last_ip = None
+    with open(file_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("|--"):
+                last_ip = line[3:].strip()
+            elif line.startswith("/32 host LOCAL") and last_ip and last_ip not in local_ips:
+                local_ips.append(last_ip)
+    return local_ips
+
+def _ioctl_local_ips():
+    """
+    IPv4 address of every interface with SIOCGIFADDR
+    """
+    import fcntl
+    import socket
+    import struct
+    local_ips = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for index, name in socket.if_nameindex():
+            try:
+                ifreq = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, struct.pack('256s', name.encode()[:15]))
+            except OSError:
+                # interface without an IPv4 address
+                continue
+            local_ips.append(socket.inet_ntoa(ifreq[20:24]))
+    return local_ips
+
+def get_local_ips():
+    """
+    IPv4 addresses of this host, read from the kernel without forking "ip addr"
+    """
+    for method in (_fib_trie_local_ips, _ioctl_local_ips):
+        try:
+            local_ips = method()
+        except (OSError, ImportError, AttributeError):
+            continue
+        if local_ips:
+            return local_ips
+    return _ip_addr_local_ips()
+
+def nodes_ready():
+    try:
+        nodes = kube_api("/api/v1/nodes")['items']
+    except Exception:
+        return _kubectl_nodes_ready()
+    conditions = [{item['type']: item['status'] for item in node['status'].get('conditions') or []}
+                  for node in nodes]
+    return bool(nodes) and all(condition.get("Ready") == "True" for condition in conditions)
+
+def _kubectl_master_ip():
     # Run `kubectl get nodes -o wide` to get node details
-    result = subprocess.run(["kubectl", "get", "nodes", "-o", "wide"], capture_output=True, text=True)
+    result = subprocess.run(kubectl("get", "nodes", "-o", "wide"), capture_output=True, text=True)
 
     if result.returncode != 0:
         print(f"Error executing kubectl command: {result.stderr}")
@@ -31,7 +357,7 @@ def get_kubernetes_master_ip():
     print("No master node found.")
     return None
 
-def get_local_ips():
+def _ip_addr_local_ips():
     # Run `ip addr` to get local network interface details
     result = subprocess.run(["ip", "addr"], capture_output=True, text=True)
 
@@ -45,42 +371,95 @@ def get_local_ips():
 
     return local_ips
 
-def install_helm():
-    helm_version = "v3.11.2"
+def install_helm(cache):
     system = platform.system().lower()
-    helm_url = f"https://get.helm.sh/helm-{helm_version}-linux-amd64.tar.gz"
-    print(f"Downloading Helm from {helm_url}...")
-    subprocess.run(["curl", "-LO", helm_url], check=True)
+    tarball = f"helm-{HELM_VERSION}-{system}-amd64.tar.gz"
+    helm_url = f"https://get.helm.sh/{tarball}"
+
+    installed = shutil.which("helm")
+    if installed:
+        result = subprocess.run([installed, "version", "--short"], capture_output=True, text=True)
+        if result.stdout.startswith(HELM_VERSION):
+            print(f"Helm {HELM_VERSION} is already installed")
+            return 0
+
+    try:
+        expected_sha256 = None
+        if not cache.get(tarball):
+            # get.helm.sh publishes "<sha256>  <file>" next to every tarball
+            sum_file = cache.fetch(f"{tarball}.sha256sum", f"{helm_url}.sha256sum")
+            with open(sum_file, 'r') as file:
+                expected_sha256 = file.read().split()[0]
+        tarball_path = cache.fetch(tarball, helm_url, expected_sha256)
+    except Exception as e:
+        print(f"Error when downloading helm {e}")
+        return 1
+
     print("Installing Helm...")
     try:
-        subprocess.run(["tar", "-zxvf", f"helm-{helm_version}-{system}-amd64.tar.gz"], check=True)
-        helm_binary = f"{system}-amd64/helm"
-        subprocess.run(["sudo", "mv", helm_binary, "/usr/local/bin/helm"], check=True)
-        subprocess.run(["sudo", "chmod", "+x", "/usr/local/bin/helm"], check=True)
-        os.remove(f"helm-{helm_version}-{system}-amd64.tar.gz")
-        os.rmdir(f"{system}-amd64")
+        import tarfile
+        with tempfile.TemporaryDirectory() as extract_dir:
+            with tarfile.open(tarball_path, 'r:gz') as archive:
+                archive.extract(f"{system}-amd64/helm", extract_dir)
+            helm_binary = os.path.join(extract_dir, f"{system}-amd64", "helm")
+            run_command(["sudo", "mv", helm_binary, "/usr/local/bin/helm"], check=True)
+            run_command(["sudo", "chmod", "+x", "/usr/local/bin/helm"], check=True)
     except Exception as e:
         print(f"Error when installing helm {e}")
+        return 1
 
     return 0
 
-def configure_longhorn_repo():
-    print("Adding Longhorn Helm repository...")
-    subprocess.run(["helm", "repo", "add", "longhorn", "https://charts.longhorn.io"], check=True)
+def chart_version(name):
+    """
+    Version of a longhorn-<version>.tgz name as a tuple of ints, for sorting
+    """
+    match = re.match(r"longhorn-(\d+(?:\.\d+)*)", name)
+    return tuple(int(part) for part in match.group(1).split(".")) if match else ()
 
-    print("Updating Helm repositories...")
-    subprocess.run(["helm", "repo", "update"], check=True)
+def configure_longhorn_repo(cache, version=None, refresh=False, values_file=VALUES_FILE):
+    """
+    Cache the Longhorn chart and save its default values to values_file,
+    returns the path of the chart archive or None
+    """
+    chart = f"longhorn-{version}.tgz" if version else None
+    chart_path = cache.get(chart) if chart and not refresh else None
+    if chart_path is None and cache.offline:
+        # without a pinned version the newest cached chart is used
+        cached = sorted((name for name in cache.index if name.startswith("longhorn-") and name.endswith(".tgz")),
+                        key=chart_version)
+        chart = chart or (cached[-1] if cached else None)
+        chart_path = cache.get(chart) if chart else None
+        if chart_path is None:
+            print(f"Longhorn chart {chart or ''} is not in the cache {cache.cache_dir} (offline mode)")
+            return None
 
-    print("Searching for Longhorn chart in Helm repositories...")
-    subprocess.run(["helm", "search", "repo", "longhorn"], check=True)
+    if chart_path is None:
+        print("Adding Longhorn Helm repository...")
+        run_command(["helm", "repo", "add", "longhorn", LONGHORN_REPO], check=True)
 
-    print("Saving Longhorn default values to /tmp/longhorn-values.yaml...")
-    subprocess.run(["helm show values longhorn/longhorn > /tmp/longhorn-values.yaml"], shell=True)
+        print("Updating Helm repositories...")
+        run_command(["helm", "repo", "update", "longhorn"], check=True)
 
-    return 0
+        print("Pulling the Longhorn chart into the cache...")
+        with tempfile.TemporaryDirectory(dir=cache.cache_dir) as pull_dir:
+            pull = ["helm", "pull", "longhorn/longhorn", "--destination", pull_dir]
+            if version:
+                pull += ["--version", version]
+            run_command(pull, check=True)
+            pulled = os.listdir(pull_dir)[0]
+            chart_path = cache.put(pulled, os.path.join(pull_dir, pulled))
+    else:
+        print(f"Using cached {os.path.basename(chart_path)}")
+
+    print(f"Saving Longhorn default values to {values_file}...")
+    # values come from the chart archive, no repository access needed
+    with open(values_file, 'w') as file:
+        subprocess.run(["helm", "show", "values", chart_path], stdout=file, check=True)
 
-def modify_longhorn_values():
-    file_path = "/tmp/longhorn-values.yaml"
+    return chart_path
+
+def modify_longhorn_values(file_path=VALUES_FILE):
 
     # Load the current YAML data
     with open(file_path, 'r') as file:
@@ -92,76 +471,378 @@ def modify_longhorn_values():
         data['service']['ui']['nodePort'] = 30001
     else:
         print("The structure of the YAML file is not as expected.")
-        return
+        return 1
 
     # Write the modified YAML back to the file
     with open(file_path, 'w') as file:
         yaml.dump(data, file)
 
     print(f"Modified {file_path} with the specified values.")
+    return 0
 
 def set_permissions():
     print("Setting permissions for /etc/rancher/k3s/k3s.yaml to 644...")
     try:
-        subprocess.run(["mkdir", "-p", "/root/.kube"], check=True)
-        subprocess.run(["cp", "/etc/rancher/k3s/k3s.yaml", "/root/.kube/config"], check=True)
-        subprocess.run(["sudo", "chmod", "644", "/etc/rancher/k3s/k3s.yaml"], check=True)
+        run_command(["mkdir", "-p", "/root/.kube"], check=True)
+        run_command(["cp", "/etc/rancher/k3s/k3s.yaml", "/root/.kube/config"], check=True)
+        run_command(["sudo", "chmod", "644", "/etc/rancher/k3s/k3s.yaml"], check=True)
         print("Permissions set successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Error setting permissions: {e}")
+        return 1
+    return 0
 
-def execute_additional_commands():
+def execute_additional_commands(chart="longhorn/longhorn", values_file=VALUES_FILE):
     print("Executing additional Helm command to install/upgrade Longhorn...")
     try:
-        subprocess.run([
-            "helm", "install", "longhorn", "longhorn/longhorn",
+        run_command(helm_kube(
+            "upgrade", "--install", "longhorn", chart,
             "--namespace", "longhorn-system", "--create-namespace",
-            "-f", "/tmp/longhorn-values.yaml"
-        ], check=True)
+            "-f", values_file
+        ), check=True)
         print("Longhorn installed/upgraded successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Error executing command: {e}")
+        return 1
+    return 0
 
-def apply_rancher_yaml(url):
-    yaml_file_path = "/tmp/rancher.yaml"
+def rancher_yaml_name(url):
+    return "rancher-" + hashlib.sha256(url.encode()).hexdigest()[:16] + ".yaml"
 
-    # Download Rancher YAML using curl and save to /tmp/rancher.yaml
-    print(f"Downloading Rancher YAML from {url}...")
+def fetch_rancher_yaml(url, cache, refresh=False):
+    # the manifest is cached per URL, --refresh downloads it again
     try:
-        subprocess.run(
-            ["curl", "--insecure", "-sfL", url, "-o", yaml_file_path],
-            check=True
-        )
-        print(f"Rancher YAML downloaded to {yaml_file_path}.")
-    except subprocess.CalledProcessError as e:
+        return cache.fetch(rancher_yaml_name(url), url, insecure=True, refresh=refresh)
+    except Exception as e:
         print(f"Error downloading Rancher YAML: {e}")
-        return
+        return None
+
+def apply_rancher_yaml(url, cache, refresh=False, yaml_file_path=None):
+    yaml_file_path = yaml_file_path or fetch_rancher_yaml(url, cache, refresh)
+    if yaml_file_path is None:
+        return 1
 
     # Apply the downloaded YAML file using kubectl
     print("Applying Rancher YAML using kubectl...")
     try:
-        subprocess.run(
-            ["kubectl", "apply", "-f", yaml_file_path],
+        run_command(
+            kubectl("apply", "-f", yaml_file_path),
             check=True
         )
         print("Rancher YAML applied successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Error applying Rancher YAML: {e}")
+        return 1
+    return 0
+
+def wait_until(check, description, timeout=600, interval=2, max_interval=30):
+    """
+    Poll check() with exponential backoff until it returns True, returns 0 when it did
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if check():
+            print(f"{description}: ready")
+            return 0
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"{description}: not ready after {timeout}s")
+            return 1
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+def _kubectl_nodes_ready():
+    result = subprocess.run(kubectl("get", "nodes", "--no-headers"), capture_output=True, text=True)
+    lines = result.stdout.split("\n") if result.returncode == 0 else []
+    statuses = [line.split()[1] for line in lines if line.strip()]
+    return bool(statuses) and all(status == "Ready" for status in statuses)
+
+def longhorn_ready():
+    result = subprocess.run(kubectl("-n", "longhorn-system", "get", "pods", "--no-headers"),
+                            capture_output=True, text=True)
+    lines = result.stdout.split("\n") if result.returncode == 0 else []
+    pods = [line.split() for line in lines if line.strip()]
+    # READY column is "<ready>/<total>", finished job pods count as ready
+    return bool(pods) and all(pod[2] == "Completed" or pod[1].split("/")[0] == pod[1].split("/")[1]
+                              for pod in pods)
+
+def run_steps(steps, workers=4):
+    """
+    Run the steps {name: (method, [dependencies])} as a dependency graph. A step runs
+    as soon as all its dependencies succeeded, independent steps run concurrently.
+    A step succeeds when it returns 0, anything else or an exception fails it
+    and the steps depending on it are skipped. Lines printed by a step are
+    prefixed with its name. Returns {name: (status, start, duration)}, start
+    is relative to the start of the run.
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    for name, (method, deps) in steps.items():
+        unknown = [dep for dep in deps if dep not in steps]
+        if unknown:
+            raise ValueError(f"step {name} depends on unknown steps {unknown}")
+
+    # topological order (Kahn), steps may be declared before their dependencies
+    waiting = {name: set(deps) for name, (method, deps) in steps.items()}
+    order = []
+    ready = [name for name, deps in waiting.items() if not deps]
+    while ready:
+        name = ready.pop(0)
+        order.append(name)
+        for other, deps in waiting.items():
+            if name in deps:
+                deps.discard(name)
+                if not deps:
+                    ready.append(other)
+    if len(order) < len(steps):
+        raise ValueError(f"dependency cycle between {sorted(set(steps) - set(order))}")
+
+    report = {}
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def run(name):
+        start = time.monotonic()
+        _step.name, _step.buffer = name, ""
+        try:
+            result = steps[name][0]()
+            status = "ok" if type(result) is int and result == 0 else "failed"
+        except Exception as e:
+            print(f"failed: {e}")
+            status = "failed"
+        finally:
+            if _step.buffer:
+                print()
+            _step.name = None
+        with lock:
+            report[name] = (status, start - started, time.monotonic() - start)
+        return status
+
+    pending = {name: steps[name] for name in order}
+    running = {}
+    stdout, sys.stdout = sys.stdout, _stepOutput(sys.stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = pending[name][1]
+                    if any(report.get(dep, ("",))[0] in ("failed", "skipped") for dep in deps):
+                        report[name] = ("skipped", time.monotonic() - started, 0.0)
+                        del pending[name]
+                    elif all(report.get(dep, ("",))[0] == "ok" for dep in deps):
+                        running[pool.submit(run, name)] = name
+                        del pending[name]
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+    finally:
+        sys.stdout = stdout
+    return report
+
+def print_timing(report, file_name=None):
+    total = max((start + duration for status, start, duration in report.values()), default=0.0)
+    print("=" * 70)
+    print(f"{'step':<22} {'status':<8} {'start':>9} {'duration':>10}")
+    for name, (status, start, duration) in sorted(report.items(), key=lambda item: item[1][1]):
+        print(f"{name:<22} {status:<8} {start:8.1f}s {duration:9.1f}s")
+    serial = sum(duration for status, start, duration in report.values())
+    print(f"total {total:.1f}s, {serial:.1f}s if run in sequence")
+    if file_name:
+        with open(file_name, 'w') as file:
+            json.dump({'total': total, 'steps': {name: {'status': status, 'start': start, 'duration': duration}
+                                                 for name, (status, start, duration) in report.items()}},
+                      file, indent=2)
+
+
+def read_contexts(contexts, contexts_file, default_url):
+    """
+    [(context, rancher url)] from --contexts and --contexts-file, a file line is
+    "<context> [<rancher yaml url>]", the positional url is the default. A context
+    listed more than once is installed once, with its first url.
+    """
+    clusters = [(context.strip(), default_url) for context in (contexts or "").split(",") if context.strip()]
+    if contexts_file:
+        with open(contexts_file, 'r') as file:
+            for line in file:
+                fields = line.split("#", 1)[0].split()
+                if fields:
+                    clusters.append((fields[0], fields[1] if len(fields) > 1 else default_url))
+    urls = {}
+    for context, url in clusters:
+        if context not in urls:
+            urls[context] = url
+        elif urls[context] != url:
+            print(f"{context} is listed more than once, using {urls[context]}")
+    return list(urls.items())
+
+def fan_out(clusters, args, cache):
+    """
+    Run the installer for every (context, url) in its own process, at most
+    args.parallel at a time, with one log file per cluster. Returns 0 when every
+    cluster succeeded.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # log, timing and values files are named after the context
+    names = {}
+    for context, url in clusters:
+        names.setdefault(re.sub(r"[^A-Za-z0-9_.-]+", "_", context), []).append(context)
+    clashes = [contexts for contexts in names.values() if len(contexts) > 1]
+    if clashes:
+        print("contexts " + "; ".join(", ".join(contexts) for contexts in clashes) +
+              " would share their log files, rename them")
+        return 1
+    safe_names = {context: safe for safe, contexts in names.items() for context in contexts}
+
+    # shared artifacts (helm, chart, every distinct Rancher YAML) are fetched once
+    # here, the clusters run offline and only read the cache
+    os.makedirs(args.log_dir, exist_ok=True)
+    if install_helm(cache) != 0:
+        return 1
+    chart = configure_longhorn_repo(cache, args.longhorn_version, args.refresh,
+                                    os.path.join(args.log_dir, "longhorn-values.yaml"))
+    if chart is None:
+        return 1
+    version = os.path.basename(chart)[len("longhorn-"):-len(".tgz")]
+    for url in dict.fromkeys(url for context, url in clusters):
+        if fetch_rancher_yaml(url, cache, args.refresh) is None:
+            return 1
+
+    print(f"Installing Longhorn {version} on {len(clusters)} clusters, {args.parallel} at a time, "
+          f"logs in {args.log_dir}")
+
+    def install(cluster):
+        context, url = cluster
+        safe = safe_names[context]
+        log_file = os.path.join(args.log_dir, f"{safe}.log")
+        timing_file = os.path.join(args.log_dir, f"{safe}.timing.json")
+        command = [sys.executable, os.path.abspath(__file__), url, "--context", context,
+                   "--cache-dir", args.cache_dir, "--longhorn-version", version,
+                   "--values-file", os.path.join(args.log_dir, f"{safe}.values.yaml"),
+                   "--timeout", str(args.timeout), "--timing-report", timing_file, "--offline"]
+        if args.no_wait:
+            command.append("--no-wait")
+        start = time.monotonic()
+        with open(log_file, 'w') as log:
+            returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode
+        failed_steps = []
+        if os.path.exists(timing_file):
+            with open(timing_file, 'r') as file:
+                failed_steps = [name for name, step in json.load(file)['steps'].items() if step['status'] != "ok"]
+        duration = time.monotonic() - start
+        print(f"{context}: {'ok' if returncode == 0 else 'FAILED'} after {duration:.0f}s")
+        return returncode, duration, failed_steps, log_file
+
+    with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+        results = dict(zip(clusters, pool.map(install, clusters)))
+
+    print("=" * 70)
+    print(f"{'cluster':<30} {'status':<8} {'duration':>9}  failed steps / log")
+    failed = 0
+    for (context, url), (returncode, duration, failed_steps, log_file) in results.items():
+        if returncode != 0:
+            failed += 1
+        detail = ", ".join(failed_steps) if failed_steps else ""
+        print(f"{context:<30} {'ok' if returncode == 0 else 'FAILED':<8} {duration:8.0f}s  "
+              f"{detail + ' ' if detail else ''}{log_file}")
+    print(f"{len(results) - failed} clusters succeeded, {failed} failed")
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
 
-    parser = argparse.ArgumentParser(description="Apply Rancher YAML to Kubernetes.")
+    parser = argparse.ArgumentParser(
+        description="Apply Rancher YAML to Kubernetes.",
+        epilog="With --contexts/--contexts-file every cluster is installed by its own process with "
+               "--context; local kind or k3d clusters (contexts kind-<name>, k3d-<name>) can stand in "
+               "for edge sites.")
     parser.add_argument("url", help="URL of the Rancher YAML file")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"checksum verified artifact cache (default {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--offline", action="store_true",
+                        help="use only cached artifacts, never access the network")
+    parser.add_argument("--longhorn-version", help="pin the Longhorn chart version")
+    parser.add_argument("--refresh", action="store_true",
+                        help="download the chart and Rancher YAML again even when cached")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="only fill the cache, e.g. to copy it to an air-gapped site")
+    parser.add_argument("--timeout", type=int, default=600,
+                        help="seconds to wait for the nodes and for Longhorn to become ready")
+    parser.add_argument("--no-wait", action="store_true", help="do not wait for the Longhorn pods")
+    parser.add_argument("--timing-report", help="also write the per step timing as JSON to this file")
+    parser.add_argument("--context", help="install on this kubeconfig context instead of the local k3s master")
+    parser.add_argument("--contexts", help="comma separated kubeconfig contexts to install on concurrently")
+    parser.add_argument("--contexts-file", help="file with one \"<context> [<rancher yaml url>]\" per line")
+    parser.add_argument("--parallel", type=int, default=4, help="clusters installed at the same time")
+    parser.add_argument("--log-dir", default="longhorn-install-logs", help="per cluster logs and timing")
+    parser.add_argument("--values-file", default=VALUES_FILE, help="where the Longhorn values are prepared")
     args = parser.parse_args()
+    if args.parallel < 1:
+        parser.error("--parallel must be at least 1")
+
+    cache = artifactCache(args.cache_dir, args.offline)
+    if args.prefetch:
+        system = platform.system().lower()
+        tarball = f"helm-{HELM_VERSION}-{system}-amd64.tar.gz"
+        try:
+            sum_file = cache.fetch(f"{tarball}.sha256sum", f"https://get.helm.sh/{tarball}.sha256sum", refresh=True)
+            with open(sum_file, 'r') as file:
+                cache.fetch(tarball, f"https://get.helm.sh/{tarball}", file.read().split()[0])
+            # the chart is pulled with helm
+            if install_helm(cache) != 0:
+                raise SystemExit(1)
+            if configure_longhorn_repo(cache, args.longhorn_version, args.refresh) is None:
+                raise SystemExit(1)
+            cache.fetch(rancher_yaml_name(args.url), args.url, insecure=True, refresh=args.refresh)
+        except Exception as e:
+            print(f"Error when filling the cache {args.cache_dir}: {e}")
+            raise SystemExit(1)
+        print(f"Cache {args.cache_dir} is ready for offline installs")
+        raise SystemExit(0)
+
+    clusters = read_contexts(args.contexts, args.contexts_file, args.url)
+    if clusters:
+        raise SystemExit(fan_out(clusters, args, cache))
+
+    KUBE_CONTEXT = args.context
+    if KUBE_CONTEXT:
+        master_ip = local_ips = None
+    else:
+        master_ip = get_kubernetes_master_ip()
+        local_ips = get_local_ips()
+    # Check if the master IP is among the local interfaces, a --context cluster is remote
+    if KUBE_CONTEXT or master_ip in local_ips:
+        results = {}
+
+        def chart_step():
+            results['chart'] = configure_longhorn_repo(cache, args.longhorn_version, args.refresh, args.values_file)
+            return 0 if results['chart'] else 1
+
+        def rancher_fetch_step():
+            results['rancher'] = fetch_rancher_yaml(args.url, cache, args.refresh)
+            return 0 if results['rancher'] else 1
 
-    master_ip = get_kubernetes_master_ip()
-    local_ips = get_local_ips()
-    # Check if the master IP is among the local interfaces
-    if master_ip in local_ips:
-        install_helm()
-        configure_longhorn_repo()
-        modify_longhorn_values()
-        set_permissions()
-        execute_additional_commands()
-        apply_rancher_yaml(args.url)
+        # name: (method, dependencies)
+        steps = {
+            'install_helm': (lambda: install_helm(cache), []),
+            'set_permissions': (set_permissions, []),
+            'fetch_rancher_yaml': (rancher_fetch_step, []),
+            'nodes_ready': (lambda: wait_until(nodes_ready, "kubernetes nodes", args.timeout), ['set_permissions']),
+            'longhorn_chart': (chart_step, ['install_helm']),
+            'longhorn_values': (lambda: modify_longhorn_values(args.values_file), ['longhorn_chart']),
+            'install_longhorn': (lambda: execute_additional_commands(results['chart'], args.values_file),
+                                 ['longhorn_values', 'nodes_ready']),
+            'apply_rancher_yaml': (lambda: apply_rancher_yaml(args.url, cache, yaml_file_path=results['rancher']),
+                                   ['fetch_rancher_yaml', 'nodes_ready']),
+        }
+        if KUBE_CONTEXT:
+            # the kubeconfig of a remote cluster is already in place
+            steps['set_permissions'] = (lambda: 0, [])
+        if not args.no_wait:
+            steps['longhorn_ready'] = (lambda: wait_until(longhorn_ready, "longhorn pods", args.timeout),
+                                       ['install_longhorn'])
+        report = run_steps(steps)
+        print_timing(report, args.timing_report)
+        raise SystemExit(0 if all(status == "ok" for status, start, duration in report.values()) else 1)
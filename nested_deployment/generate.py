@@ -0,0 +1,241 @@
+"""
+Generate the IoT Edge deployment manifest of every device of a nested topology.
+
+Each device gets a base manifest (base.topedge for devices without a parent,
+base.nested below them) with its layers applied on top, in order. Layer keys
+such as "properties.desired.modules.IoTEdgeAPIProxy" are paths into the
+"properties.desired" of the base, like layered deployments on IoT Hub.
+
+Topology file (JSON or YAML):
+
+    {
+        "devices": [
+            {"name": "top-1", "hostname": "top-1.plant.local"},
+            {"name": "gw-1", "parent": "top-1", "layers": ["nested.gateway"]},
+            {"name": "sensor-1", "parent": "gw-1", "layers": ["nested.tempsensor"],
+             "set": {"$edgeHub": {"properties.desired.storeAndForwardConfiguration.timeToLiveSecs": 600}}}
+        ]
+    }
+
+"base" overrides the default base, "hostname" defaults to the name and
+"set" holds device specific keys, merged last like a layer.
+
+"$upstream" in module images becomes the hostname of the parent device
+(--keep-upstream leaves it to the edge runtime). "$upstream" in routes is
+the IoT Edge keyword for the parent hub and is never replaced.
+createOptions may be written as JSON objects in layers and topology, they
+are serialized to the escaped string form. Longer than the 512 characters
+IoT Edge accepts, the first 512 stay in createOptions and the rest goes to
+createOptions01 ... createOptions07, IoT Edge reads no further chunks.
+
+The composition of a base and its layers is rendered to a string once and
+shared by every device using the same combination, only the upstream
+hostname is filled in per device.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+DESIRED = "properties.desired"
+CREATE_OPTIONS_CHUNK = 512
+# createOptions plus createOptions01 ... createOptions07
+CREATE_OPTIONS_MAX_CHUNKS = 8
+# stands in for the parent hostname inside the cached templates
+UPSTREAM_MARK = "@@UPSTREAM_HOST@@"
+
+
+def read_file(file_path):
+    with open(file_path, 'r') as file:
+        if file_path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def deep_merge(target, source):
+    """
+    Merge source into target, nested objects are merged, everything else replaced
+    """
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            deep_merge(target[key], value)
+        else:
+            target[key] = json.loads(json.dumps(value)) if isinstance(value, (dict, list)) else value
+    return target
+
+
+def apply_layer(manifest, layer):
+    """
+    Apply a layer (or device "set" keys) to a manifest, in place
+    """
+    content = manifest.setdefault('modulesContent', {})
+    layer_content = layer.get('modulesContent', layer)
+    for module, properties in layer_content.items():
+        twin = content.setdefault(module, {})
+        for key, value in properties.items():
+            if key == DESIRED:
+                deep_merge(twin.setdefault(DESIRED, {}), value)
+            elif key.startswith(DESIRED + "."):
+                # "properties.desired.a.b": value sets a.b inside properties.desired
+                node = twin.setdefault(DESIRED, {})
+                path = key[len(DESIRED) + 1:].split(".")
+                for name in path[:-1]:
+                    node = node.setdefault(name, {})
+                if isinstance(value, dict) and isinstance(node.get(path[-1]), dict):
+                    deep_merge(node[path[-1]], value)
+                else:
+                    node[path[-1]] = json.loads(json.dumps(value))
+            else:
+                twin[key] = value
+    return manifest
+
+
+def _modules(manifest):
+    desired = manifest['modulesContent'].get('$edgeAgent', {}).get(DESIRED, {})
+    for group in ('systemModules', 'modules'):
+        for module in (desired.get(group) or {}).values():
+            yield module
+
+
+def finalize(manifest, keep_upstream=False):
+    """
+    Serialize createOptions objects and mark $upstream in module images
+    """
+    for module in _modules(manifest):
+        settings = module.get('settings') or {}
+        options = settings.get('createOptions')
+        if isinstance(options, (dict, list)):
+            options = json.dumps(options, separators=(',', ':'))
+            settings['createOptions'] = options
+        if isinstance(options, str) and len(options) > CREATE_OPTIONS_CHUNK:
+            if len(options) > CREATE_OPTIONS_CHUNK * CREATE_OPTIONS_MAX_CHUNKS:
+                raise ValueError(f"createOptions of module image {settings.get('image')} is {len(options)} "
+                                 f"characters, IoT Edge accepts {CREATE_OPTIONS_CHUNK * CREATE_OPTIONS_MAX_CHUNKS}")
+            settings['createOptions'] = options[:CREATE_OPTIONS_CHUNK]
+            for index in range(CREATE_OPTIONS_CHUNK, len(options), CREATE_OPTIONS_CHUNK):
+                settings[f"createOptions{index // CREATE_OPTIONS_CHUNK:02d}"] = \
+                    options[index:index + CREATE_OPTIONS_CHUNK]
+        if not keep_upstream and isinstance(settings.get('image'), str):
+            settings['image'] = settings['image'].replace("$upstream", UPSTREAM_MARK)
+    return manifest
+
+
+class generator(object):
+
+    def __init__(self, manifest_dir, keep_upstream=False, indent=4):
+        self.manifest_dir = manifest_dir
+        self.keep_upstream = keep_upstream
+        self.indent = indent
+        self._files = {}
+        self._templates = {}
+
+    def _load(self, kind, name):
+        """
+        base/layer manifest by short name (nested, nested.gateway) or path, read once
+        """
+        key = (kind, name)
+        if key not in self._files:
+            file_path = name if os.path.sep in name or name.endswith('.json') else \
+                os.path.join(self.manifest_dir, f"{kind}.{name}.deployment.manifest.json")
+            self._files[key] = read_file(file_path)
+        return self._files[key]
+
+    def compose(self, base, layers, overrides=None):
+
+        manifest = json.loads(json.dumps(self._load('base', base)))
+        for layer in layers:
+            apply_layer(manifest, self._load('layer', layer))
+        if overrides:
+            apply_layer(manifest, overrides)
+        return finalize(manifest, self.keep_upstream)
+
+    def template(self, base, layers):
+        """
+        Rendered manifest of a base and layers combination, shared by all devices using it
+        """
+        key = (base, tuple(layers))
+        if key not in self._templates:
+            self._templates[key] = json.dumps(self.compose(base, layers), indent=self.indent)
+        return self._templates[key]
+
+    def render(self, device, parent=None):
+
+        base = device.get('base') or ("nested" if device.get('parent') else "topedge")
+        if device.get('set'):
+            text = json.dumps(self.compose(base, device.get('layers') or [], device['set']), indent=self.indent)
+        else:
+            text = self.template(base, device.get('layers') or [])
+        if UPSTREAM_MARK in text:
+            if parent is None:
+                raise ValueError(f"device {device['name']} uses $upstream images but has no parent")
+            # the mark sits inside a JSON string, the hostname is escaped for it
+            host = json.dumps(parent.get('hostname') or parent['name'])[1:-1]
+            text = text.replace(UPSTREAM_MARK, host)
+        return text
+
+
+def ordered_devices(devices):
+    """
+    Devices with every parent before its children, checks the parent references
+    """
+    by_name = {}
+    for device in devices:
+        if device['name'] in by_name:
+            raise ValueError(f"device {device['name']} is listed twice")
+        by_name[device['name']] = device
+    for device in devices:
+        if device.get('parent') and device['parent'] not in by_name:
+            raise ValueError(f"device {device['name']} has unknown parent {device['parent']}")
+
+    ordered = []
+    placed = set()
+    for device in devices:
+        chain = []
+        seen = set()
+        current = device
+        while current and current['name'] not in placed:
+            if current['name'] in seen:
+                raise ValueError(f"parent cycle through {current['name']}")
+            seen.add(current['name'])
+            chain.append(current)
+            current = by_name.get(current.get('parent'))
+        for item in reversed(chain):
+            placed.add(item['name'])
+            ordered.append(item)
+    return ordered, by_name
+
+
+def generate(topology, manifest_dir, out_dir, keep_upstream=False):
+    """
+    Write <out_dir>/<device>.deployment.json for every device, returns the number written
+    """
+    devices, by_name = ordered_devices(topology['devices'])
+    gen = generator(manifest_dir, keep_upstream)
+    os.makedirs(out_dir, exist_ok=True)
+    for device in devices:
+        text = gen.render(device, by_name.get(device.get('parent')))
+        with open(os.path.join(out_dir, f"{device['name']}.deployment.json"), 'w') as file:
+            file.write(text)
+            file.write("\n")
+    print(f"{len(devices)} manifests written to {out_dir}, {len(gen._templates)} shared templates")
+    return len(devices)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generate IoT Edge deployment manifests for a nested topology.")
+    parser.add_argument("topology", help="JSON or YAML topology file")
+    parser.add_argument("--out", default="deployments", help="output directory (default deployments)")
+    parser.add_argument("--manifest-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="directory of the base.* and layer.* manifests")
+    parser.add_argument("--keep-upstream", action="store_true",
+                        help="leave $upstream in module images for the edge runtime to resolve")
+    args = parser.parse_args()
+
+    try:
+        generate(read_file(args.topology), args.manifest_dir, args.out, args.keep_upstream)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -4,7 +4,7 @@ Supported datastore <type> are HTTP, HTTPS, AWSS3, AZUREBLOB, CONTAINERREGISTRY
 Default origin type is Local
 
 Usage:
-  apiHelper.py login --username=<username> --password=<password>
+  apiHelper.py login --username=<username> --password=<password> [--url=<url>]
   apiHelper.py datastore create <name> <type> [--fqdn=<fqdn>] [--region=<region>] [--apikey=<apikey>] [--apipass=<password>] [--dpath=<dpath>] [--origin-type=<origin-type>] [--description=<description>]
   apiHelper.py image create <name> --datastore=<datastore_name> --arch=[AMD64|ARM64] [--origin-type=<global|local>] [--description=<description>]
   apiHelper.py image uplink <name> --image-sha=<image-sha> --image-size=<image-size>
@@ -12,90 +12,366 @@ Usage:
   apiHelper.py datastore update <name>
   apiHelper.py image update <name>
   apiHelper.py edge-app update <name>
-  apiHelper.py edge-app refresh <name>
+  apiHelper.py edge-app refresh <name> [--wait]
+  apiHelper.py jobs wait <job-name>... [--timeout=<seconds>]
+  apiHelper.py edge-app create-bulk <manifest-dir> [--journal=<journal>] [--origin-type=<global|local>]
+  apiHelper.py image uplink-bulk <uplink.csv> [--journal=<journal>]
+  apiHelper.py edge-app publish <manifest.json>... --datastore=<datastore_name> [--fqdn=<fqdn>] [--arch=<arch>] [--workers=<workers>] [--origin-type=<global|local>]
+  apiHelper.py edge-app deploy <name> --nodes=<nodes-file> [--netinst=<netinst>] [--waves=<waves>] [--workers=<workers>] [--max-failure=<percent>] [--wave-timeout=<seconds>]
+  apiHelper.py netinst create-bulk <template> --nodes=<nodes-file> [--site=<site>] [--workers=<workers>]
+  apiHelper.py edge-node onboard <nodes-file> [--workers=<workers>] [--retries=<retries>] [--no-activate] [--report=<report>]
+  apiHelper.py status watch [--kind=<kind>...] [--until-online] [--state-file=<file>] [--interval=<seconds>] [--timeout=<seconds>]
+  apiHelper.py teardown (--prefix=<prefix> | --all) [--kind=<kind>...] [--workers=<workers>] [--yes]
+  apiHelper.py export <archive> [--kind=<kind>...] [--workers=<workers>]
+  apiHelper.py restore <archive> [--kind=<kind>...] [--workers=<workers>]
+  apiHelper.py validate <payload.json>...
+  apiHelper.py inventory sync [--db=<db>] [--kind=<kind>...]
+  apiHelper.py inventory query <kind> [--name=<name>] [--datastore=<datastore_name>] [--update-available] [--db=<db>]
+
+Bulk commands record progress in --journal (default <command>.journal); rerun
+with the same journal to resume an interrupted run.
+<uplink.csv> holds one "name,image-sha,image-size" line per image.
+Inventory <kind> is one of datastore, image, app, edge-node, netinst, app-instance
+edge-app publish creates every distinct container image of the manifests once in the container
+registry given with --datastore (created with --fqdn when missing), rewrites the manifests to
+the shared images and creates the edge-apps, see libs/publish.py.
+edge-app deploy reads one edge-node name per line from --nodes and deploys in --waves,
+a comma separated list of node counts or percentages (default 1,10%,50%). A wave
+only starts when less than --max-failure percent (default 10) of the previous one failed.
+netinst create-bulk expands a network instance <template> for every node in --nodes,
+see libs/netinst.py for the template placeholders.
+status watch polls edge-node and app-instance states and prints only the changes
+and a summary; --until-online stops once everything is RUN_STATE_ONLINE.
+teardown deletes the objects whose name starts with --prefix in dependency order
+(app-instance, app, image, datastore, then user and enterprise when given with --kind),
+or every object of those kinds with --all. Without --yes it only lists what would be deleted.
+export/restore <archive> is gzip compressed NDJSON of enterprises, datastores, images,
+apps and users (--kind selects some of them).
+<nodes-file> for onboard is a CSV or YAML list of edge nodes, see libs/onboard.py for the fields.
+--output=ndjson|csv on any command writes one record per object or operation to stdout
+as soon as it is done, all other output goes to stderr.
+--profile=sample|cpu|mem[:<prefix>] on any command writes a stack sample, cProfile or
+allocation profile and the network wait times, see libs/profiling.py.
+The controller URL given at login is saved in config.json, ZEDCONTROL_URL overrides it.
 '''
 
-from docopt import docopt
-import os, sys, json
-from libs.zapi import zapi
+import os, sys, json, csv
+from libs.config import CANARY_URL, open_session
 from libs.resourceCreate import *
+from libs.schema import validate, validate_files
+from libs.output import emit, enabled, machine_output, pop_output_option
 
-def login():
+def edge_app_create_bulk(args):
 
     print("=" * 100)
-    zmethod = "login"
+    zmethod = "Edge-app bulk create"
     print(zmethod.center(70))
     print("=" * 100)
-    username = zsession.username
-    password = zsession.password
-    status, token = zsession.login()
-    if status != 0:
-        print(f"login failed reason: {token}")
+
+    manifests = {}
+    for file_name in sorted(os.listdir(args['<manifest-dir>'])):
+        if file_name.endswith('.json'):
+            manifests[file_name[:-len('.json')]] = os.path.join(args['<manifest-dir>'], file_name)
+
+    invalid = validate_files(manifests.values())
+    if invalid:
+        for file_name, errors in invalid.items():
+            print(f"{file_name}: " + "; ".join(errors))
+        print(f"{len(invalid)} of {len(manifests)} manifests are invalid, nothing created")
         return 1
-    user_config = {
-        'username': zsession.username,
-        'password': zsession.password,
-        'auth_token': token
-    }
-
-    with open('config.json', 'w') as f:
-        f.write(json.dumps(user_config, indent=4))
-    return 0
 
+    from libs.journal import journal
+    ops = journal(args['--journal'] or "edge-app-create.journal")
+    ops.plan(manifests)
+    failed = 0
+    for name in ops.pending():
+        app_args = {'<name>': name, '--manifest': manifests[name]}
+        if args['--origin-type']:
+            app_args['--origin-type'] = args['--origin-type']
+        failed += ops.run(zsession, name, edgeAppCreate, zsession, app_args)
+    print(f"edge-app bulk create {ops.summary()}")
+    ops.close()
+    return 1 if failed else 0
+
+
+def image_uplink_bulk(args):
+
+    print("=" * 100)
+    zmethod = "Image bulk uplink"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    uplinks = {}
+    with open(args['<uplink.csv>'], 'r') as f:
+        for row in csv.reader(f):
+            if row and not row[0].startswith('#'):
+                name, image_sha, image_size = [col.strip() for col in row]
+                uplinks[name] = {'<name>': name, '--image-sha': image_sha, '--image-size': image_size}
+
+    from libs.journal import journal
+    ops = journal(args['--journal'] or "image-uplink.journal")
+    ops.plan(uplinks)
+    failed = 0
+    for name in ops.pending():
+        failed += ops.run(zsession, name, imageUplink, zsession, uplinks[name])
+    print(f"image bulk uplink {ops.summary()}")
+    ops.close()
+    return 1 if failed else 0
+
+
+def edge_app_publish(args):
+
+    print("=" * 100)
+    zmethod = "Edge-app publish"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    invalid = validate_files(args['<manifest.json>'])
+    if invalid:
+        for file_name, errors in invalid.items():
+            print(f"{file_name}: " + "; ".join(errors))
+        print(f"{len(invalid)} of {len(args['<manifest.json>'])} manifests are invalid, nothing created")
+        return 1
+
+    from libs.publish import datastore, publish, read_manifests
+    ds = datastore(zsession, args['--datastore'], args['--fqdn'])
+    if ds is None:
+        return 1
+    result = publish(zsession, read_manifests(args['<manifest.json>']), ds,
+                     (args['--arch'] or "AMD64").upper(), args['--origin-type'], int(args['--workers'] or 8))
+    failed = [name for name, state in result.items() if state.startswith("failed")]
+    print(f"{len(result) - len(failed)} edge-apps published, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+def edge_app_deploy(args):
+
+    print("=" * 100)
+    zmethod = "Edge-app wave rollout"
+    print(zmethod.center(70))
+    print("=" * 100)
 
-def create_user_credentials(username, password):
+    from libs.bulk import read_node_names
+    from libs.rollout import rollout
+    deploy = rollout(zsession, args['<name>'], args['--netinst'] or "",
+                     workers=int(args['--workers'] or 8),
+                     max_failure=float(args['--max-failure'] or 10),
+                     wave_timeout=int(args['--wave-timeout'] or 1800))
+    return deploy.run(read_node_names(args['--nodes']), args['--waves'] or "1,10%,50%")
 
-    payload = {
-        'owner': username,
-        'type': 'CREDENTIAL_TYPE_PASSWORD',
-        'newCred': password
-    }
-    status, response = zsession.post_request('/api/v1/credentials', payload)
-    return status
 
-def create_config(username, password):
+def netinst_create_bulk(args):
 
-    user_data = {
-        "username": username,
-        "password": password
-    }
-    with open('config.json', 'w') as f:
-        f.write(json.dumps(user_data, indent=4))
-    return user_data
+    print("=" * 100)
+    zmethod = "Network instance bulk create"
+    print(zmethod.center(70))
+    print("=" * 100)
 
-def read_config():
-    file_name = "config.json"
-    with open("config.json", 'r') as f:
-        user_config = json.load(f)
-    return user_config
+    from libs.bulk import read_node_names
+    from libs.netinst import netinstCreateBulk, read_template
+    try:
+        result = netinstCreateBulk(zsession, read_template(args['<template>']),
+                                   read_node_names(args['--nodes']), args['--site'] or "",
+                                   int(args['--workers'] or 8))
+    except ValueError as e:
+        print(f"netinst create: {e}")
+        return 1
+    failed = [name for name, state in result.items() if state.startswith("failed")]
+    print(f"network instances {len(result) - len(failed)} ok, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+def edge_node_onboard(args):
 
-def main():
+    print("=" * 100)
+    zmethod = "Edge-node bulk onboard"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    from libs.onboard import onboarder, read_nodes, write_report
+    nodes = read_nodes(args['<nodes-file>'])
+    workers = int(args['--workers'] or 8)
+    retries = int(args['--retries'] or 3)
+    status = onboarder(zsession, workers, retries, not args['--no-activate']).run(nodes)
+    if args['--report']:
+        write_report(status, args['--report'])
+    failed = [name for name, state in status.items() if state.startswith("failed")]
+    print(f"edge-node onboard {len(status) - len(failed)} succeeded, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+def status_watch(args):
+
+    from libs.status import poller
+    kinds = args['--kind'] or None
+    targets = {}
+    if args['--until-online']:
+        targets = {kind: "RUN_STATE_ONLINE" for kind in kinds or ['edge-node', 'app-instance']}
+    fleet = poller(zsession, kinds, targets, args['--state-file'],
+                   interval=int(args['--interval'] or 10))
+    timeout = int(args['--timeout']) if args['--timeout'] else None
+    return fleet.watch(timeout)
+
+
+def jobs_wait(args):
+
+    from libs.jobs import jobTracker
+    def done(name, job, duration):
+        print(f"job {name} {job.get('status')} after {duration:.1f}s")
+        emit({'op': "job", 'name': name, 'status': job.get('status'), 'duration': duration})
+
+    tracker = jobTracker(zsession, on_done=done)
+    timeout = int(args['--timeout']) if args['--timeout'] else None
+    results = tracker.wait(args['<job-name>'], timeout)
+    failed = [name for name, result in results.items() if isinstance(result, Exception)]
+    print(f"jobs {len(results) - len(failed)} succeeded, {len(failed)} failed, durations {tracker.metrics()}")
+    return 1 if failed else 0
+
+
+def teardown_objects(args):
+
+    print("=" * 100)
+    zmethod = "Teardown"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    from libs.teardown import plan, teardown, DEFAULT_KINDS
+    prefix = None if args['--all'] else args['--prefix']
+    try:
+        selected = plan(zsession, prefix, args['--kind'] or DEFAULT_KINDS)
+    except ValueError as e:
+        print(f"teardown: {e}")
+        return 1
+    for kind, objects in selected:
+        print(f"{kind:<15} {len(objects)} to delete")
+    if not args['--yes']:
+        for kind, objects in selected:
+            for obj_id, name in objects:
+                print(f"  {kind} {name}")
+                emit({'op': "delete", 'kind': kind, 'id': obj_id, 'name': name, 'status': "planned"})
+        print("dry run, rerun with --yes to delete")
+        return 0
+
+    summary = teardown(zsession, selected, int(args['--workers'] or 8))
+    failed = 0
+    for kind, (deleted, failed_names) in summary.items():
+        failed += len(failed_names)
+        print(f"{kind:<15} deleted {deleted:<8} failed {len(failed_names)} {' '.join(failed_names)}")
+    return 1 if failed else 0
+
+
+def export_objects(args):
+
+    print("=" * 100)
+    zmethod = "Export"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    from libs.backup import export
+    counts = export(zsession, args['<archive>'], args['--kind'] or None, int(args['--workers'] or 8))
+    failed = 0
+    for kind, (count, kind_failed) in counts.items():
+        failed += kind_failed
+        emit({'op': "export", 'kind': kind, 'count': count, 'failed': kind_failed})
+    print(f"exported {sum(count for count, kind_failed in counts.values())} objects to {args['<archive>']}, "
+          f"{failed} failed")
+    return 1 if failed else 0
+
+
+def restore_objects(args):
+
+    print("=" * 100)
+    zmethod = "Restore"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    from libs.backup import restore
+    summary = restore(zsession, args['<archive>'], args['--kind'] or None, int(args['--workers'] or 8))
+    failed = 0
+    for kind, (created, existing, kind_failed) in summary.items():
+        failed += kind_failed
+        emit({'op': "restore", 'kind': kind, 'created': created, 'existing': existing, 'failed': kind_failed})
+        print(f"{kind:<15} created {created:<8} existing {existing:<8} failed {kind_failed}")
+    return 1 if failed else 0
+
+
+def validate_payloads(args):
+
+    invalid = validate_files(args['<payload.json>'])
+    for file_name in args['<payload.json>']:
+        emit({'file': file_name, 'valid': file_name not in invalid, 'errors': invalid.get(file_name, [])})
+    for file_name, errors in invalid.items():
+        for error in errors:
+            print(f"{file_name}: {error}")
+    print(f"{len(args['<payload.json>']) - len(invalid)} valid, {len(invalid)} invalid")
+    return 1 if invalid else 0
+
+
+def inventory_sync(args):
+
+    print("=" * 100)
+    zmethod = "Inventory sync"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    from libs.inventory import inventory, DEFAULT_DB
+    inv = inventory(args['--db'] or DEFAULT_DB)
+    summary = inv.sync(zsession, args['--kind'] or None)
+    inv.close()
+    for kind, (total, changed, removed) in summary.items():
+        print(f"{kind:<15} total {total:<8} changed {changed:<8} removed {removed}")
+        emit({'kind': kind, 'total': total, 'changed': changed, 'removed': removed})
+    return 0
+
+
+def inventory_query(args):
+
+    from libs.inventory import inventory, DEFAULT_DB
+    inv = inventory(args['--db'] or DEFAULT_DB)
+    update_available = True if args['--update-available'] else None
+    objects = inv.query(args['<kind>'], name=args['--name'],
+                        datastore=args['--datastore'], update_available=update_available)
+    inv.close()
+    for obj in objects:
+        if enabled():
+            emit(obj)
+        else:
+            print(json.dumps(obj))
+    return 0
+
+
+def main(argv=None):
 
     global zsession
+    from libs.profiling import pop_profile_option, run_profiled
+    profile, argv = pop_profile_option(sys.argv[1:] if argv is None else argv)
+    if profile:
+        return run_profiled(profile, main, argv)
+    output_format, argv = pop_output_option(argv)
+    if output_format:
+        with machine_output(output_format):
+            return main(argv)
+
+    from docopt import docopt
     try:
-        args = docopt(usage)
+        args = docopt(usage, argv)
     except Exception as e:
         print(e)
 
-    base_url = "https://zedcontrol.canary.zededa.net"
-    if args['login']:
-        user_config = create_config(args['--username'], args['--password'])
-        zsession = zapi(base_url, user_config)
-        status = login()
-        if status != 0:
-            print("Login to the zedCloud failed")
-            sys.exit()
-    else:
-        user_config = read_config()
-        zsession = zapi(base_url, user_config)
+    if args['inventory'] and args['query']:
+        sys.exit(inventory_query(args))
+    if args['validate']:
+        sys.exit(validate_payloads(args))
+
+    zsession = open_session(args, CANARY_URL)
+    if zsession is None:
+        print("Login to the zedCloud failed")
+        sys.exit()
 
     if args['datastore'] and args['create']:
-        urlExt = "/api/v1/datastores"
-        status, payload = constructDs(args)
+        status = datastoreCreate(zsession, args)
         if status != 0:
-            print("Construct payload for Datastore failed")
             sys.exit(1)
-        status, response = zsession.post_request(urlExt, payload)
     elif args['datastore'] and args['update']:
         status = updateDataStore(zsession, args)
 
@@ -106,6 +382,10 @@ def main():
             print(f"Get datastore {args['<name>']} failed")
             sys.exit(1)
         status, payload = imageCreate(args, response['id'])
+        errors = validate('image', payload)
+        if errors:
+            print("Image payload is invalid: " + "; ".join(errors))
+            sys.exit(1)
         url_image= "/api/v1/apps/images"
         status, response = zsession.post_request(url_image, payload)
     elif args['image'] and args['uplink']:
@@ -119,6 +399,38 @@ def main():
         updateStatus = updateEdgeApp(zsession, args)
     elif args['edge-app'] and args['refresh']:
         status = edgeAppRefresh(zsession, args)
+    elif args['edge-app'] and args['create-bulk']:
+        status = edge_app_create_bulk(args)
+    elif args['edge-app'] and args['publish']:
+        status = edge_app_publish(args)
+    elif args['edge-app'] and args['deploy']:
+        status = edge_app_deploy(args)
+
+    if args['image'] and args['uplink-bulk']:
+        status = image_uplink_bulk(args)
+
+    if args['netinst'] and args['create-bulk']:
+        status = netinst_create_bulk(args)
+
+    if args['edge-node'] and args['onboard']:
+        status = edge_node_onboard(args)
+
+    if args['export']:
+        status = export_objects(args)
+    if args['restore']:
+        status = restore_objects(args)
+
+    if args['teardown']:
+        status = teardown_objects(args)
+
+    if args['jobs'] and args['wait']:
+        status = jobs_wait(args)
+
+    if args['status'] and args['watch']:
+        status = status_watch(args)
+
+    if args['inventory'] and args['sync']:
+        status = inventory_sync(args)
 
 
 if __name__ == '__main__':
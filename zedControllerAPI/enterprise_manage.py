@@ -1,37 +1,20 @@
 usage = '''
 enterprise management example
 Usage:
-  enterprise_manage.py login --username=<username> --password=<password>
+  enterprise_manage.py login --username=<username> --password=<password> [--url=<url>]
   enterprise_manage.py user <command> <name> <type> --email=<email> [--role=<role>] [--password=<password>] [--fullname=<firstname>] [--phone=<phone>] [--timezone=<timezone>]
   enterprise_manage.py user <command> <name> [--allowed-enterprise=<allowed-enterprise>...]
   enterprise_manage.py enterprise <command> <name> --inherit-auth
-  
+
+--output=ndjson|csv on any command writes one record per operation to stdout,
+all other output goes to stderr.
+--profile=sample|cpu|mem[:<prefix>] on any command writes a stack sample, cProfile or
+allocation profile and the network wait times, see libs/profiling.py.
 '''
-from docopt import docopt
 import os, sys, json
-from libs.zapi import zapi
-
-def login():
-
-    print("=" * 100)
-    zmethod = "login"
-    print(zmethod.center(70))
-    print("=" * 100)
-    username = zsession.username
-    password = zsession.password
-    status, token = zsession.login()
-    if status != 0:
-        print(f"login failed reason: {token}")
-        return 1
-    user_config = {
-        'username': zsession.username,
-        'password': zsession.password,
-        'auth_token': token
-    }
-
-    with open('config.json', 'w') as f:
-        f.write(json.dumps(user_config, indent=4))
-    return 0
+from libs.config import HUMMINGBIRD_URL, open_session
+from libs.user import userCreate, userDelete
+from libs.output import emit, machine_output, pop_output_option
 
 def user(args):
 
@@ -49,36 +32,16 @@ def enterprise(args):
     if args['<command>'] == 'update':
         return enterprise_update(args)
 
-def user_create(args):
+def report(op, name, status):
 
-    print("=" * 100)
-    zmethod = "user create"
-    print(zmethod.center(70))
-    print("=" * 100)
+    emit({'op': op, 'name': name, 'status': "ok" if status == 0 else "failed"})
 
-    payload = {}
-    url_ext = "/api/v1/users"
-    payload['username'] = args['<name>']
-    if args['<type>'] == "Local":
-        payload['type'] = "AUTH_TYPE_LOCAL"
-    else:
-        payload['type'] = "AUTH_TYPE_OAUTH"
-    payload['email'] = args['--email']
-    if args['--role']:
-        payload['roleId'] = get_role_id(args['--role'])
-    if args['--fullname']:
-        payload['fullName'] = args['--fullname']
-    else:
-        payload['fullName'] = args['<name>']
-    if args['--timezone']:
-        payload['timeZone'] = args['--timezone']
-    if args['--phone']:
-        payload['phone'] = args[''--phone]
-    status, response = zsession.post_request(url_ext, payload)
+def user_create(args):
+
+    status = userCreate(zsession, args)
+    report("user create", args['<name>'], status)
     if status != 0:
         sys.exit()
-    if args['<type>'] == "Local":
-        status = create_user_credentials(args['<name>'], args['--password'])
 
 def user_update(args):
 
@@ -92,6 +55,7 @@ def user_update(args):
     payload = response
     allowed_enterprises = []
     if status != 0:
+        report("user update", args['<name>'], status)
         sys.exit()
     if args['--allowed-enterprise']:
 
@@ -109,17 +73,17 @@ def user_update(args):
 
     url_ext_user=f"/api/v1/users/id/{payload['id']}"
     status, response = zsession.put_request(url_ext_user, payload)
+    report("user update", args['<name>'], status)
     if status != 0:
         sys.exit()
 
 
-def user_delete():
+def user_delete(args):
 
-    print("=" * 100)
-    zmethod = "user Delete"
-    print(zmethod.center(70))
-    print("=" * 100)
-    pass
+    status = userDelete(zsession, args['<name>'])
+    report("user delete", args['<name>'], status)
+    if status != 0:
+        sys.exit()
 
 def enterprise_create(args):
 
@@ -135,6 +99,7 @@ def enterprise_create(args):
     }
 
     status, response = zsession.post_request('/api/v1/enterprises', payload)
+    report("enterprise create", args['<name>'], status)
     if status != 0:
         sys.exit()
 
@@ -159,51 +124,28 @@ def get_enterprise_id(name):
     return response['id']
 
 
-def create_user_credentials(username, password):
-
-    payload = {
-        'owner': username,
-        'type': 'CREDENTIAL_TYPE_PASSWORD',
-        'newCred': password
-    }
-    status, response = zsession.post_request('/api/v1/credentials', payload)
-    return status
-
-def create_config(username, password):
-
-    user_data = {
-        "username": username,
-        "password": password
-    }
-    with open('config.json', 'w') as f:
-        f.write(json.dumps(user_data, indent=4))
-    return user_data
-
-def read_config():
-    file_name = "config.json"
-    with open("config.json", 'r') as f:
-        user_config = json.load(f)
-    return user_config
-
-def main():
+def main(argv=None):
 
     global zsession
+    from libs.profiling import pop_profile_option, run_profiled
+    profile, argv = pop_profile_option(sys.argv[1:] if argv is None else argv)
+    if profile:
+        return run_profiled(profile, main, argv)
+    output_format, argv = pop_output_option(argv)
+    if output_format:
+        with machine_output(output_format):
+            return main(argv)
+
+    from docopt import docopt
     try:
-        args = docopt(usage)
+        args = docopt(usage, argv)
     except Exception as e:
         print(e)
 
-    base_url = "https://zedcontrol.hummingbird.zededa.net"
-    if args['login']:
-        user_config = create_config(args['--username'], args['--password'])
-        zsession = zapi(base_url, user_config)
-        status = login()
-        if status != 0:
-            print("Login to the zedcontrol failed")
-            sys.exit()
-    else:
-        user_config = read_config()
-        zsession = zapi(base_url, user_config)
+    zsession = open_session(args, HUMMINGBIRD_URL)
+    if zsession is None:
+        print("Login to the zedcontrol failed")
+        sys.exit()
 
     if args['user']:
         status = user(args)
@@ -0,0 +1,67 @@
+usage = '''
+Run the same operation on several controllers and enterprises concurrently
+<targets.json> lists the controllers/enterprises, see libs/pool.py for the format
+--output=ndjson|csv writes one record per target to stdout
+
+Usage:
+  fanout.py <targets.json> user create <name> <type> --email=<email> [--role=<role>] [--password=<password>] [--fullname=<fullname>] [--timezone=<timezone>] [--workers=<workers>]
+  fanout.py <targets.json> edge-app refresh <name> [--workers=<workers>]
+  fanout.py <targets.json> datastore create <name> <type> [--fqdn=<fqdn>] [--region=<region>] [--apikey=<apikey>] [--apipass=<password>] [--dpath=<dpath>] [--origin-type=<origin-type>] [--description=<description>] [--workers=<workers>]
+'''
+
+import sys
+from libs.bulk import DEFAULT_WORKERS
+
+
+def _present(args):
+    """
+    docopt keeps every option key, the resourceCreate helpers test for presence
+    """
+    return {key: value for key, value in args.items() if value is not None}
+
+
+def main(argv=None):
+
+    from docopt import docopt
+    from libs.output import emit, machine_output, pop_output_option
+    output_format, argv = pop_output_option(sys.argv[1:] if argv is None else argv)
+    if output_format:
+        with machine_output(output_format):
+            return main(argv)
+
+    from libs.pool import zpool
+    from libs.resourceCreate import datastoreCreate, edgeAppRefresh
+    from libs.user import userCreate
+
+    try:
+        args = docopt(usage, argv)
+    except Exception as e:
+        print(e)
+
+    workers = int(args['--workers'] or DEFAULT_WORKERS)
+    pool = zpool.from_file(args['<targets.json>'], workers)
+
+    if args['user'] and args['create']:
+        results = pool.run(userCreate, args)
+    elif args['edge-app'] and args['refresh']:
+        results = pool.run(edgeAppRefresh, args)
+    elif args['datastore'] and args['create']:
+        results = pool.run(datastoreCreate, _present(args))
+
+    print("=" * 100)
+    print("fan-out results".center(70))
+    print("=" * 100)
+    failed = 0
+    for name, result in results.items():
+        emit({'target': name, 'status': "ok" if result == 0 else f"failed: {result}"})
+        if result == 0:
+            print(f"{name:<40} ok")
+        else:
+            failed += 1
+            print(f"{name:<40} FAILED {result}")
+    print(f"{len(results) - failed} succeeded, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
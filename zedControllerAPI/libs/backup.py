@@ -0,0 +1,184 @@
+"""
+    Streaming export and restore of enterprise objects.
+
+    The archive is gzip compressed NDJSON, one {"kind": ..., "object": ...}
+    record per line, written in dependency order (enterprises, datastores,
+    images, apps, users). Export walks the list APIs page by page and fetches
+    the full objects in small concurrent batches, restore reads the archive
+    line by line and recreates each batch concurrently, so neither holds the
+    whole inventory in memory.
+
+    References between the restored objects (the enterprise of a user, the
+    datastore of an image) are remapped to the ids the objects got on the
+    target; a user whose enterprise is not in the archive joins the enterprise
+    of the account running the restore.
+
+    The controller does not return datastore secrets or user passwords,
+    restored datastores have to get their credentials set again and restored
+    users need a new password or invite; restore lists them.
+"""
+
+import gzip
+import json
+from itertools import islice
+
+from libs.bulk import parallel_map, retry, DEFAULT_WORKERS
+from libs.output import emit
+
+# dependency order: (kind, list url, get url, create url)
+EXPORT_KINDS = [
+    ('enterprise', "/api/v1/enterprises", "/api/v1/enterprises/id/{}", "/api/v1/enterprises"),
+    ('datastore', "/api/v1/datastores", "/api/v1/datastores/id/{}", "/api/v1/datastores"),
+    ('image', "/api/v1/apps/images", "/api/v1/apps/images/id/{}", "/api/v1/apps/images"),
+    ('app', "/api/v1/apps", "/api/v1/apps/id/{}", "/api/v1/apps"),
+    ('user', "/api/v1/users", "/api/v1/users/id/{}", "/api/v1/users"),
+]
+
+# fields owned by the controller, dropped before a create
+READ_ONLY = ('id', 'revision', 'parentDetail', 'imageStatus', 'imageError', 'imageLocal',
+             'datastoreIdList', 'userDefinedVersion')
+BATCH = 64
+
+
+def _batches(iterable, size):
+
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def export(zsession, file_name, kinds=None, workers=DEFAULT_WORKERS):
+    """
+    Write every object of the given kinds to the archive, returns {kind: (exported, failed)}
+    """
+    counts = {}
+    with gzip.open(file_name, 'wt', encoding="utf-8") as archive:
+        for kind, list_url, get_url, create_url in EXPORT_KINDS:
+            if kinds and kind not in kinds:
+                continue
+            exported = failed = 0
+
+            def fetch(obj_id):
+                status, response = retry(zsession, zsession.get_request, get_url.format(obj_id))
+                if status != 0:
+                    raise RuntimeError(response)
+                return response
+
+            for batch in _batches((item['id'] for item in zsession.list_request(list_url)), BATCH):
+                objects = parallel_map(fetch, batch, workers)
+                for obj_id in batch:
+                    obj = objects[obj_id]
+                    if isinstance(obj, Exception):
+                        print(f"export {kind} {obj_id} failed {obj}")
+                        failed += 1
+                        continue
+                    archive.write(json.dumps({'kind': kind, 'object': obj}) + "\n")
+                    exported += 1
+            counts[kind] = (exported, failed)
+            print(f"exported {exported} {kind} objects, {failed} failed")
+    return counts
+
+
+def _records(file_name):
+
+    with gzip.open(file_name, 'rt', encoding="utf-8") as archive:
+        for line in archive:
+            yield json.loads(line)
+
+
+def _name(obj):
+
+    return obj.get('name') or obj.get('username')
+
+
+def _create_payload(kind, obj, new_ids, target_enterprise=None):
+    """
+    Create payload of an archived object, new_ids maps the archived ids of
+    restored enterprises and datastores to their ids on the target
+    """
+    payload = {key: value for key, value in obj.items() if key not in READ_ONLY}
+    if kind == 'image' and payload.get('datastoreId') in new_ids:
+        payload['datastoreId'] = new_ids[payload['datastoreId']]
+    if kind == 'user' and payload.get('enterpriseId'):
+        if payload['enterpriseId'] in new_ids:
+            payload['enterpriseId'] = new_ids[payload['enterpriseId']]
+        elif target_enterprise:
+            payload['enterpriseId'] = target_enterprise
+    return payload
+
+
+def restore(zsession, file_name, kinds=None, workers=DEFAULT_WORKERS):
+    """
+    Recreate the archived objects, returns {kind: (created, existing, failed)}
+    """
+    create_urls = {kind: create_url for kind, list_url, get_url, create_url in EXPORT_KINDS}
+    get_by_name = {kind: get_url.replace("/id/{}", "/name/{}")
+                   for kind, list_url, get_url, create_url in EXPORT_KINDS}
+    # archived id: id on the target, for enterprises and datastores
+    new_ids = {}
+    # archived enterprises without an id on the target, their users are not restored
+    lost_enterprises = set()
+    target_enterprise = None
+    if not kinds or 'user' in kinds:
+        status, response = zsession.get_request(f"/api/v1/users/name/{zsession.username}")
+        if status == 0:
+            target_enterprise = response.get('enterpriseId')
+    new_users = []
+    summary = {}
+
+    def create(record):
+        kind, obj = record['kind'], record['object']
+        if kind == 'user' and obj.get('enterpriseId') in lost_enterprises:
+            raise RuntimeError(f"enterprise {obj['enterpriseId']} was not restored")
+        payload = _create_payload(kind, obj, new_ids, target_enterprise)
+        status, response = retry(zsession, zsession.post_request, create_urls[kind], payload)
+        if status == 0:
+            state = "created"
+        elif zsession.last_status_code == 409:
+            state = "exists"
+        else:
+            raise RuntimeError(response)
+        if kind in ('enterprise', 'datastore'):
+            # users and images of this archive refer to it by its old id
+            status, response = zsession.get_request(get_by_name[kind].format(obj['name']))
+            if status == 0:
+                new_ids[obj['id']] = response['id']
+        return state
+
+    records = (record for record in _records(file_name) if not kinds or record['kind'] in kinds)
+    for batch in _batches(records, BATCH * workers):
+        # archive order is dependency order: never mix kinds inside one concurrent run
+        start = 0
+        while start < len(batch):
+            kind = batch[start]['kind']
+            end = start
+            while end < len(batch) and batch[end]['kind'] == kind:
+                end += 1
+            tier = dict(enumerate(batch[start:end]))
+            results = parallel_map(lambda index: create(tier[index]), list(tier), workers)
+            created, existing, failed = summary.get(kind, (0, 0, 0))
+            for index, result in results.items():
+                obj = tier[index]['object']
+                state = result if isinstance(result, str) else f"failed: {result}"
+                if kind == 'user' and result == "created":
+                    new_users.append(_name(obj))
+                    state = "created, needs credentials"
+                if kind == 'enterprise' and obj['id'] not in new_ids:
+                    lost_enterprises.add(obj['id'])
+                emit({'op': "restore", 'kind': kind, 'name': _name(obj), 'status': state})
+                if result == "created":
+                    created += 1
+                elif result == "exists":
+                    existing += 1
+                else:
+                    failed += 1
+                    print(f"restore {kind} {_name(obj)} failed {result}")
+            summary[kind] = (created, existing, failed)
+            start = end
+    if new_users:
+        print(f"{len(new_users)} restored users have no password, set one or send an invite: "
+              f"{', '.join(sorted(new_users))}")
+    return summary
@@ -0,0 +1,62 @@
+"""
+    Helpers to run many controller calls concurrently.
+
+    zapi calls spend their time waiting on the network, so a thread pool
+    is enough to keep many requests in flight.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_WORKERS = 8
+
+
+def parallel_map(method, items, workers=DEFAULT_WORKERS, callback=None):
+    """
+    Run method(item) for every item with up to workers in flight.
+    Returns {item: result}; an exception raised by method is kept as the
+    result of its item. callback(item, result) is called as each one finishes.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(method, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            results[item] = result
+            if callback:
+                callback(item, result)
+    return results
+
+
+def retryable(status_code):
+    """
+    Connection errors (no status), throttling and server errors are worth a retry
+    """
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+def retry(zsession, method, *args, retries=3, backoff=1.0):
+    """
+    Call method(*args) until it returns status 0, retrying with exponential
+    backoff while the failure is retryable. Returns the last result.
+    """
+    for attempt in range(retries + 1):
+        zsession.last_status_code = None
+        result = method(*args)
+        status = result[0] if isinstance(result, tuple) else result
+        if status == 0 or not retryable(zsession.last_status_code) or attempt == retries:
+            return result
+        time.sleep(backoff * (2 ** attempt))
+    return result
+
+
+def read_node_names(file_name):
+    """
+    Edge-node names from a file holding one name per line
+    """
+    with open(file_name, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
@@ -0,0 +1,79 @@
+"""
+    Login and config.json handling shared by the zedcontrol command line tools.
+
+    The controller URL is taken from, in order: the ZEDCONTROL_URL environment
+    variable, the base_url saved in config.json at login (--url), and the
+    default of the calling tool.
+"""
+
+import json
+import os
+
+CONFIG_FILE = "config.json"
+CANARY_URL = "https://zedcontrol.canary.zededa.net"
+HUMMINGBIRD_URL = "https://zedcontrol.hummingbird.zededa.net"
+
+
+def controller_url(user_config, default_url):
+
+    return os.environ.get("ZEDCONTROL_URL") or user_config.get('base_url') or default_url
+
+
+def create_config(username, password, base_url=None, file_name=CONFIG_FILE):
+
+    user_data = {
+        "username": username,
+        "password": password
+    }
+    if base_url:
+        user_data['base_url'] = base_url
+    with open(file_name, 'w') as f:
+        f.write(json.dumps(user_data, indent=4))
+    return user_data
+
+
+def read_config(file_name=CONFIG_FILE):
+
+    with open(file_name, 'r') as f:
+        user_config = json.load(f)
+    return user_config
+
+
+def login(zsession, file_name=CONFIG_FILE):
+
+    print("=" * 100)
+    zmethod = "login"
+    print(zmethod.center(70))
+    print("=" * 100)
+    status, token = zsession.login()
+    if status != 0:
+        print(f"login failed reason: {token}")
+        return 1
+    user_config = {
+        'username': zsession.username,
+        'password': zsession.password,
+        'auth_token': token,
+        'base_url': zsession.base_url
+    }
+
+    with open(file_name, 'w') as f:
+        f.write(json.dumps(user_config, indent=4))
+    return 0
+
+
+def open_session(args, default_url):
+    """
+    zapi session for a command: logs in for the login command,
+    reuses the saved config.json otherwise
+    """
+    from libs.zapi import zapi
+
+    if args['login']:
+        user_config = create_config(args['--username'], args['--password'], args['--url'])
+        zsession = zapi(controller_url(user_config, default_url), user_config)
+        if login(zsession) != 0:
+            return None
+        return zsession
+
+    user_config = read_config()
+    return zapi(controller_url(user_config, default_url), user_config)
@@ -0,0 +1,169 @@
+"""
+    Local SQLite mirror of zedcontrol objects.
+
+    Every sync walks the list API of each object kind and compares the
+    revision of each entry with the one stored locally; only new or changed
+    objects are fetched in full, and objects gone from the controller are
+    removed. Queries are then answered from the local database.
+"""
+
+import json
+import sqlite3
+import time
+
+DEFAULT_DB = "inventory.db"
+
+# kind: (list url, get-by-id url)
+KINDS = {
+    'datastore': ("/api/v1/datastores", "/api/v1/datastores/id/{}"),
+    'image': ("/api/v1/apps/images", "/api/v1/apps/images/id/{}"),
+    'app': ("/api/v1/apps", "/api/v1/apps/id/{}"),
+    'edge-node': ("/api/v1/devices", "/api/v1/devices/id/{}"),
+    'netinst': ("/api/v1/netinsts", "/api/v1/netinsts/id/{}"),
+    'app-instance': ("/api/v1/apps/instances", "/api/v1/apps/instances/id/{}"),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    revision TEXT,
+    project_id TEXT,
+    datastore_id TEXT,
+    app_id TEXT,
+    device_id TEXT,
+    update_available INTEGER,
+    state TEXT,
+    data TEXT,
+    PRIMARY KEY (kind, id)
+);
+CREATE INDEX IF NOT EXISTS objects_name ON objects (kind, name);
+CREATE INDEX IF NOT EXISTS objects_datastore ON objects (datastore_id);
+CREATE INDEX IF NOT EXISTS objects_app ON objects (app_id);
+CREATE INDEX IF NOT EXISTS objects_device ON objects (device_id);
+CREATE INDEX IF NOT EXISTS objects_project ON objects (project_id);
+CREATE INDEX IF NOT EXISTS objects_update ON objects (kind, update_available);
+CREATE TABLE IF NOT EXISTS sync_state (
+    kind TEXT PRIMARY KEY,
+    synced_at REAL,
+    total INTEGER,
+    changed INTEGER,
+    removed INTEGER
+);
+'''
+
+
+def _revision(item):
+    """
+    Change marker of a list entry: the revision counter when the controller
+    reports one, the whole entry otherwise
+    """
+    revision = item.get('revision') or {}
+    if revision.get('curr'):
+        return f"{revision['curr']}@{revision.get('updatedAt', '')}"
+    if revision.get('updatedAt'):
+        return revision['updatedAt']
+    return json.dumps(item, sort_keys=True)
+
+
+def _columns(kind, obj):
+
+    parent = obj.get('parentDetail') or {}
+    update_available = parent.get('updateAvailable')
+    return {
+        'name': obj.get('name'),
+        'project_id': obj.get('projectId'),
+        'datastore_id': obj.get('datastoreId'),
+        'app_id': obj.get('appId'),
+        'device_id': obj.get('deviceId'),
+        'update_available': None if update_available is None else int(update_available),
+        'state': obj.get('runState') or obj.get('status') or obj.get('adminState'),
+    }
+
+
+class inventory(object):
+
+    def __init__(self, db_path=DEFAULT_DB):
+
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def sync(self, zsession, kinds=None):
+        """
+        Bring the local mirror up to date, returns {kind: (total, changed, removed)}
+        """
+        summary = {}
+        for kind in kinds or KINDS:
+            summary[kind] = self.sync_kind(zsession, kind)
+        return summary
+
+    def sync_kind(self, zsession, kind):
+
+        list_url, get_url = KINDS[kind]
+        known = {row['id']: row['revision'] for row in
+                 self.db.execute("SELECT id, revision FROM objects WHERE kind = ?", (kind,))}
+        seen = set()
+        changed = 0
+        for item in zsession.list_request(list_url):
+            obj_id = item['id']
+            seen.add(obj_id)
+            revision = _revision(item)
+            if known.get(obj_id) == revision:
+                continue
+
+            status, obj = zsession.get_request(get_url.format(obj_id))
+            if status != 0:
+                print(f"get {kind} {item.get('name')} failed, keeping list entry {obj}")
+                # no revision, so the next sync fetches the full object again
+                obj = item
+                revision = None
+            self._store(kind, obj_id, revision, obj)
+            changed += 1
+
+        removed = [(kind, obj_id) for obj_id in known if obj_id not in seen]
+        self.db.executemany("DELETE FROM objects WHERE kind = ? AND id = ?", removed)
+        self.db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)",
+                        (kind, time.time(), len(seen), changed, len(removed)))
+        self.db.commit()
+        return len(seen), changed, len(removed)
+
+    def _store(self, kind, obj_id, revision, obj):
+
+        columns = _columns(kind, obj)
+        self.db.execute(
+            "INSERT OR REPLACE INTO objects (kind, id, name, revision, project_id, datastore_id,"
+            " app_id, device_id, update_available, state, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, obj_id, columns['name'], revision, columns['project_id'],
+             columns['datastore_id'], columns['app_id'], columns['device_id'],
+             columns['update_available'], columns['state'], json.dumps(obj)))
+
+    def query(self, kind, name=None, datastore=None, update_available=None):
+        """
+        Objects of a kind matching the given filters, datastore is a datastore name
+        """
+        sql = "SELECT o.data FROM objects o"
+        where = ["o.kind = ?"]
+        params = [kind]
+        if datastore is not None:
+            sql += " JOIN objects d ON d.kind = 'datastore' AND d.id = o.datastore_id"
+            where.append("d.name = ?")
+            params.append(datastore)
+        if name is not None:
+            where.append("o.name = ?")
+            params.append(name)
+        if update_available is not None:
+            where.append("o.update_available = ?")
+            params.append(int(update_available))
+
+        sql += " WHERE " + " AND ".join(where) + " ORDER BY o.name"
+        return [json.loads(row['data']) for row in self.db.execute(sql, params)]
+
+    def last_sync(self):
+        return {row['kind']: dict(row) for row in self.db.execute("SELECT * FROM sync_state")}
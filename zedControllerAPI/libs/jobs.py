@@ -0,0 +1,211 @@
+"""
+    Tracker for controller jobs (/api/v1/jobs).
+
+    Every tracked job gets a concurrent.futures.Future which resolves to the
+    final job object, or fails with jobFailed. A single background thread
+    polls all pending jobs concurrently; each job is polled again after an
+    interval which grows while its status does not change and resets when it
+    does. A job the controller does not know (404), or one whose polls keep
+    failing, fails instead of being polled forever. Per-job durations are
+    taken from the controller timestamps of the job and kept for metrics.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, wait as wait_futures
+
+from libs.bulk import parallel_map, DEFAULT_WORKERS
+
+SUCCESS_STATES = ("JOB_STATUS_SUCCESS", "JOB_STATUS_COMPLETE")
+FAILED_STATES = ("JOB_STATUS_FAILED", "JOB_STATUS_PARTIAL_SUCCESS", "JOB_STATUS_CANCELLED")
+# consecutive failed polls before a job is given up
+MAX_POLL_ERRORS = 5
+
+
+class jobFailed(Exception):
+
+    def __init__(self, name, job):
+        super().__init__(f"job {name} ended with {job.get('status')}")
+        self.name = name
+        self.job = job
+
+
+def _timestamp(value):
+
+    from datetime import datetime
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def duration(job):
+    """
+    Seconds from creation to the last update of a finished job object, None
+    when the controller did not report both
+    """
+    revision = job.get('revision') or {}
+    start, end = _timestamp(revision.get('createdAt')), _timestamp(revision.get('updatedAt'))
+    if start is None or end is None:
+        return None
+    return max(0.0, end - start)
+
+
+class _tracked(object):
+
+    __slots__ = ('name', 'future', 'submitted', 'status', 'interval', 'next_poll', 'errors')
+
+    def __init__(self, name, interval):
+        self.name = name
+        self.future = Future()
+        self.submitted = time.time()
+        self.errors = 0
+        self.status = None
+        self.interval = interval
+        self.next_poll = self.submitted + interval
+
+
+class jobTracker(object):
+
+    def __init__(self, zsession, min_interval=2.0, max_interval=60.0, backoff=1.5,
+                 workers=DEFAULT_WORKERS, on_done=None):
+
+        self.zsession = zsession
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.workers = workers
+        self.on_done = on_done
+        self.durations = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def submit(self, data):
+        """
+        Create a job from its payload and track it, returns its Future
+        """
+        status, response = self.zsession.post_request("/api/v1/jobs", data)
+        if status != 0:
+            future = Future()
+            future.set_exception(RuntimeError(f"create job {data['name']} failed {response}"))
+            return future
+        return self.track(data['name'])
+
+    def track(self, name, callback=None):
+        """
+        Track an existing job by name, callback(future) runs when it completes
+        """
+        with self._lock:
+            job = self._jobs.get(name)
+            if job is None:
+                job = self._jobs[name] = _tracked(name, self.min_interval)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll_loop, name="jobTracker", daemon=True)
+                self._thread.start()
+        if callback:
+            job.future.add_done_callback(callback)
+        self._wakeup.set()
+        return job.future
+
+    def awaitable(self, name):
+        """
+        asyncio awaitable of a tracked job, for use inside a running event loop
+        """
+        import asyncio
+        return asyncio.wrap_future(self.track(name))
+
+    def wait(self, names, timeout=None):
+        """
+        Block until the given jobs finished or timeout seconds elapsed for all of
+        them together, returns {name: job or exception}
+        """
+        futures = {name: self.track(name) for name in names}
+        wait_futures(list(futures.values()), timeout)
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                results[name] = TimeoutError(f"job {name} not finished after {timeout}s")
+                continue
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+        return results
+
+    def _poll(self, job):
+
+        self.zsession.last_status_code = None
+        status, response = self.zsession.get_request(f"/api/v1/jobs/name/{job.name}")
+        if status != 0:
+            if self.zsession.last_status_code == 404:
+                raise LookupError(f"job {job.name} not found")
+            raise RuntimeError(f"poll job {job.name} failed {response}")
+        return response
+
+    def _finish(self, job, response):
+
+        # local time since track() only when the controller has no timestamps
+        taken = duration(response)
+        self.durations[job.name] = taken if taken is not None else time.time() - job.submitted
+        if response.get('status') in SUCCESS_STATES:
+            job.future.set_result(response)
+        else:
+            job.future.set_exception(jobFailed(job.name, response))
+        if self.on_done:
+            self.on_done(job.name, response, self.durations[job.name])
+
+    def _poll_loop(self):
+
+        while True:
+            with self._lock:
+                pending = [job for job in self._jobs.values() if not job.future.done()]
+                if not pending:
+                    self._thread = None
+                    return
+            now = time.time()
+            due = [job for job in pending if job.next_poll <= now]
+            if due:
+                responses = parallel_map(self._poll, due, self.workers)
+                now = time.time()
+                for job in due:
+                    response = responses.get(job)
+                    if isinstance(response, Exception):
+                        job.errors += 1
+                        if isinstance(response, LookupError) or job.errors >= MAX_POLL_ERRORS:
+                            job.future.set_exception(response)
+                            continue
+                    else:
+                        job.errors = 0
+                    status = response.get('status') if isinstance(response, dict) else None
+                    if status in SUCCESS_STATES or status in FAILED_STATES:
+                        self._finish(job, response)
+                        continue
+                    if status is not None and status != job.status:
+                        job.interval = self.min_interval
+                    else:
+                        job.interval = min(job.interval * self.backoff, self.max_interval)
+                    job.status = status
+                    job.next_poll = now + job.interval
+            # cleared before looking at the jobs, a track() from now on wakes the wait up
+            self._wakeup.clear()
+            with self._lock:
+                waiting = [job.next_poll for job in self._jobs.values() if not job.future.done()]
+            if waiting:
+                self._wakeup.wait(max(0.0, min(waiting) - time.time()))
+
+    def metrics(self):
+        """
+        count, mean, p50, p95 and max of the completed job durations in seconds
+        """
+        values = sorted(self.durations.values())
+        if not values:
+            return {'count': 0}
+        return {
+            'count': len(values),
+            'mean': sum(values) / len(values),
+            'p50': values[len(values) // 2],
+            'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+            'max': values[-1],
+        }
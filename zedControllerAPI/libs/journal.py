@@ -0,0 +1,111 @@
+"""
+    Append-only checkpoint journal for bulk operations.
+
+    Each line of the journal is a JSON record {"key", "state", ...} where
+    state is one of planned, done or failed. Records are flushed and synced
+    to disk as soon as they are written, so an interrupted run can be
+    restarted with the same journal and only the unfinished keys are run.
+"""
+
+import json
+import os
+import time
+
+from libs.output import emit
+
+PLANNED = "planned"
+DONE = "done"
+FAILED = "failed"
+
+
+class journal(object):
+
+    def __init__(self, path):
+
+        self.path = path
+        self.state = {}
+        # keys of this run, the journal file may hold keys of earlier runs
+        self.planned = []
+        self._load()
+        self.f = open(path, 'a', encoding="utf-8")
+
+    def _load(self):
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last line torn by a crash, the operation is simply rerun
+                    continue
+                self.state[record['key']] = record['state']
+
+    def _write(self, key, state, **details):
+
+        record = {'key': key, 'state': state, 'time': time.time()}
+        record.update(details)
+        self.f.write(json.dumps(record) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.state[key] = state
+        if state != PLANNED:
+            emit(record)
+
+    def close(self):
+        self.f.close()
+
+    def plan(self, keys):
+        """
+        Record the operations of a run, keys already in the journal are kept as is
+        """
+        for key in keys:
+            if key not in self.state:
+                self._write(key, PLANNED)
+            self.planned.append(key)
+
+    def pending(self):
+        """
+        Keys planned in this run that are not done yet
+        """
+        return [key for key in self.planned if self.state[key] != DONE]
+
+    def is_done(self, key):
+        return self.state.get(key) == DONE
+
+    def run(self, zsession, key, method, *args):
+        """
+        Run method(*args) for key unless the journal already has it done.
+        A 409 from the controller means the object exists and counts as done.
+        Returns 0 when the key is done.
+        """
+        if self.is_done(key):
+            print(f"{key} already done, skipping")
+            return 0
+
+        zsession.last_status_code = None
+        try:
+            status = method(*args)
+        except Exception as e:
+            self._write(key, FAILED, reason=str(e))
+            return 1
+        if isinstance(status, tuple):
+            status = status[0]
+
+        if status == 0:
+            self._write(key, DONE)
+            return 0
+        if zsession.last_status_code == 409:
+            self._write(key, DONE, conflict=True)
+            return 0
+
+        self._write(key, FAILED, http_status=zsession.last_status_code)
+        return 1
+
+    def summary(self):
+
+        counts = {PLANNED: 0, DONE: 0, FAILED: 0}
+        for key in self.planned or self.state:
+            counts[self.state[key]] += 1
+        return counts
@@ -0,0 +1,110 @@
+"""
+    Templated bulk creation of network instances.
+
+    The template (YAML or JSON) is a list of network instance payloads. Any
+    string may use the placeholders {node}, {node_id}, {index} (1 based
+    position of the node) and {site}, for example:
+
+        - name: "{node}-MGT-NET"
+          kind: NETWORK_INSTANCE_KIND_LOCAL
+          type: NETWORK_INSTANCE_DHCP_TYPE_V4
+          port: eth0
+          ip:
+            subnet: "10.{index}.0.0/24"
+            gateway: "10.{index}.0.1"
+            dhcpRange: {start: "10.{index}.0.20", end: "10.{index}.0.30"}
+        - name: "{node}-WAN-NET"
+          kind: NETWORK_INSTANCE_KIND_SWITCH
+          type: NETWORK_INSTANCE_DHCP_TYPE_UNSPECIFIED
+
+    deviceId, projectId and title are filled in when the template leaves them out.
+"""
+
+import json
+import re
+
+from libs.bulk import parallel_map, retry, DEFAULT_WORKERS
+from libs.output import emit
+
+_PLACEHOLDER = re.compile(r'\{(node|node_id|index|site)\}')
+
+
+def read_template(file_name):
+
+    with open(file_name, 'r') as f:
+        if file_name.endswith(('.yaml', '.yml')):
+            import yaml
+            template = yaml.safe_load(f)
+        else:
+            template = json.load(f)
+    return template if isinstance(template, list) else [template]
+
+
+def _expand(value, variables):
+
+    if isinstance(value, str):
+        return _PLACEHOLDER.sub(lambda match: str(variables[match.group(1)]), value)
+    if isinstance(value, dict):
+        return {key: _expand(item, variables) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand(item, variables) for item in value]
+    return value
+
+
+def expand(template, nodes, site=""):
+    """
+    One payload per template entry and node, in node order. Raises ValueError
+    when two payloads get the same name, e.g. a template name without {node}.
+    """
+    payloads = []
+    for index, node in enumerate(nodes, 1):
+        variables = {'node': node['name'], 'node_id': node['id'], 'index': index, 'site': site}
+        for entry in template:
+            payload = _expand(entry, variables)
+            payload.setdefault('title', payload['name'])
+            payload.setdefault('deviceId', node['id'])
+            if node.get('projectId'):
+                payload.setdefault('projectId', node['projectId'])
+            payloads.append(payload)
+    from collections import Counter
+    duplicates = sorted(name for name, count in Counter(payload['name'] for payload in payloads).items()
+                        if count > 1)
+    if duplicates:
+        raise ValueError(f"template expands to duplicate names {', '.join(duplicates)}")
+    return payloads
+
+
+def netinstCreateBulk(zsession, template, node_names, site="", workers=DEFAULT_WORKERS):
+    """
+    Expand the template over the nodes and create the missing network instances,
+    returns {netinst name: status}
+    """
+    wanted = set(node_names)
+    nodes = {node['name']: node for node in zsession.list_request("/api/v1/devices")
+             if node['name'] in wanted}
+    missing = [name for name in node_names if name not in nodes]
+    if missing:
+        print(f"unknown edge nodes skipped: {', '.join(missing)}")
+
+    payloads = expand(template, [nodes[name] for name in node_names if name in nodes], site)
+    existing = {item['name'] for item in zsession.list_request("/api/v1/netinsts")}
+    result = {payload['name']: "exists" for payload in payloads if payload['name'] in existing}
+    for name in result:
+        emit({'op': "netinst create", 'name': name, 'status': "exists"})
+    todo = {payload['name']: payload for payload in payloads if payload['name'] not in existing}
+    print(f"{len(payloads)} network instances, {len(result)} exist, {len(todo)} to create")
+
+    def create(name):
+        status, response = retry(zsession, zsession.post_request, "/api/v1/netinsts", todo[name])
+        if status == 0 or zsession.last_status_code == 409:
+            return "created"
+        return f"failed: {response}"
+
+    def report(name, state):
+        print(f"{name}: {state}")
+        emit({'op': "netinst create", 'name': name, 'status': str(state)})
+
+    created = parallel_map(create, list(todo), workers, callback=report)
+    for name, state in created.items():
+        result[name] = f"failed: {state}" if isinstance(state, Exception) else state
+    return result
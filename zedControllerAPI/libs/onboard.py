@@ -0,0 +1,175 @@
+"""
+    Bulk edge-node onboarding.
+
+    Nodes are read from a CSV or YAML file with the fields
+        name, serialno, onboarding_key, model, project, description, ports
+    model and project are names or ids. In CSV, ports is a ';' separated list
+    of intfname:usage[:netname], e.g.
+        eth0:ADAPTER_USAGE_MANAGEMENT:sjc-eve-net;eth1:ADAPTER_USAGE_APP_SHARED
+    In YAML, ports is a list of {intfname, usage, netname}.
+
+    Nodes which already exist are not created again, they are only activated.
+"""
+
+import csv
+import json
+import re
+import threading
+
+from libs.bulk import parallel_map, retry, DEFAULT_WORKERS
+from libs.output import emit
+
+USAGE_PREFIX = "ADAPTER_USAGE_"
+_UUID = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+def _parse_ports(ports):
+
+    if isinstance(ports, list):
+        return ports
+    parsed = []
+    for entry in filter(None, (ports or "").split(';')):
+        fields = entry.strip().split(':')
+        parsed.append({
+            'intfname': fields[0],
+            'usage': fields[1] if len(fields) > 1 else "ADAPTER_USAGE_APP_SHARED",
+            'netname': fields[2] if len(fields) > 2 else "",
+        })
+    return parsed
+
+
+def read_nodes(file_name):
+
+    if file_name.endswith(('.yaml', '.yml')):
+        import yaml
+        with open(file_name, 'r') as f:
+            nodes = yaml.safe_load(f)
+        if isinstance(nodes, dict):
+            nodes = nodes.get('nodes', [])
+    else:
+        with open(file_name, 'r', newline='') as f:
+            nodes = [row for row in csv.DictReader(f) if row.get('name')]
+
+    for node in nodes:
+        node['ports'] = _parse_ports(node.get('ports'))
+    return nodes
+
+
+def nodePayload(node, model_id, project_id):
+
+    payload = {
+        'name': node['name'],
+        'title': node.get('title') or node['name'],
+        'serialno': node['serialno'],
+        'onboardingKey': node.get('onboarding_key', ""),
+        'modelId': model_id,
+        'projectId': project_id,
+        'description': node.get('description', ""),
+        'adminState': "ADMIN_STATE_ACTIVE",
+        'interfaces': [],
+    }
+    for port in node['ports']:
+        usage = port.get('usage', "APP_SHARED").upper()
+        payload['interfaces'].append({
+            'intfname': port['intfname'],
+            'intfUsage': usage if usage.startswith(USAGE_PREFIX) else USAGE_PREFIX + usage,
+            'netname': port.get('netname') or "",
+            'cost': int(port.get('cost', 0)),
+            'tags': {},
+        })
+    return payload
+
+
+class onboarder(object):
+
+    def __init__(self, zsession, workers=DEFAULT_WORKERS, retries=3, activate=True):
+
+        self.zsession = zsession
+        self.workers = workers
+        self.retries = retries
+        self.activate = activate
+        self.status = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, kind, url, value):
+        """
+        id of a model or project given by name or id, looked up once per name
+        """
+        if _UUID.match(value):
+            return value
+        key = (kind, value)
+        with self._lock:
+            if key in self._ids:
+                return self._ids[key]
+        status, response = retry(self.zsession, self.zsession.get_request, url.format(value),
+                                 retries=self.retries)
+        obj_id = response['id'] if status == 0 else None
+        with self._lock:
+            self._ids[key] = obj_id
+        return obj_id
+
+    def _activate(self, node_id):
+
+        return retry(self.zsession, self.zsession.put_request,
+                     f"/api/v1/devices/id/{node_id}/activate", retries=self.retries)
+
+    def _onboard(self, node):
+
+        name = node['name']
+        node_id = self.existing.get(name)
+        if node_id is None:
+            model_id = self._resolve('model', "/api/v1/sysmodels/name/{}", node['model'])
+            project_id = self._resolve('project', "/api/v1/projects/name/{}", node['project'])
+            if model_id is None or project_id is None:
+                return "failed: unknown model or project"
+
+            payload = nodePayload(node, model_id, project_id)
+            status, response = retry(self.zsession, self.zsession.post_request,
+                                     "/api/v1/devices", payload, retries=self.retries)
+            if status != 0 and self.zsession.last_status_code != 409:
+                return f"failed: create {response}"
+
+            status, response = self.zsession.get_request(f"/api/v1/devices/name/{name}")
+            if status != 0:
+                return f"failed: get {response}"
+            node_id = response['id']
+            state = "created"
+        else:
+            state = "exists"
+
+        if self.activate:
+            status, response = self._activate(node_id)
+            if status != 0:
+                return f"failed: activate {response}"
+            state += ", activated"
+        return state
+
+    def _report(self, name, state):
+
+        if isinstance(state, Exception):
+            state = f"failed: {state}"
+        with self._lock:
+            self.status[name] = state
+            done = len(self.status)
+        print(f"[{done}/{self.total}] {name}: {state}")
+        emit({'op': "onboard", 'name': name, 'status': state})
+
+    def run(self, nodes):
+        """
+        Onboard all nodes concurrently, returns {node name: status}
+        """
+        self.total = len(nodes)
+        self.existing = {item['name']: item['id'] for item in
+                         self.zsession.list_request("/api/v1/devices")}
+        by_name = {node['name']: node for node in nodes}
+        parallel_map(lambda name: self._onboard(by_name[name]), list(by_name), self.workers,
+                     callback=self._report)
+        return self.status
+
+
+def write_report(status, file_name):
+
+    with open(file_name, 'w') as f:
+        for name, state in sorted(status.items()):
+            f.write(json.dumps({'name': name, 'status': state}) + "\n")
@@ -0,0 +1,91 @@
+"""
+    Machine readable output for the command line tools.
+
+    With --output=ndjson or --output=csv every object or operation result is
+    written to stdout as one record as soon as it is known, and flushed right
+    away. The human readable progress output (banners, request logs) moves
+    to stderr so stdout carries only records. Without --output, emit() does
+    nothing and the tools print as before.
+"""
+
+import csv
+import json
+import sys
+import threading
+from contextlib import contextmanager, redirect_stdout
+
+FORMATS = ('ndjson', 'csv')
+# csv columns, the same for every command; keys of a record not listed here
+# go to "details" as one JSON object, so no field is dropped
+CSV_COLUMNS = ('op', 'kind', 'name', 'status', 'details')
+
+_emitter = None
+
+
+class emitter(object):
+
+    def __init__(self, output_format, stream):
+
+        self.output_format = output_format
+        self.stream = stream
+        self.writer = None
+        self.lock = threading.Lock()
+
+    def write(self, record):
+
+        with self.lock:
+            if self.output_format == 'ndjson':
+                self.stream.write(json.dumps(record, separators=(',', ':')) + "\n")
+            else:
+                if self.writer is None:
+                    self.writer = csv.DictWriter(self.stream, fieldnames=CSV_COLUMNS)
+                    self.writer.writeheader()
+                row = {key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                       for key, value in record.items() if key in CSV_COLUMNS}
+                details = {key: value for key, value in record.items() if key not in CSV_COLUMNS}
+                if details:
+                    row['details'] = json.dumps(details, separators=(',', ':'))
+                self.writer.writerow(row)
+            self.stream.flush()
+
+
+def pop_output_option(argv):
+    """
+    Remove --output=<format> from the command line, returns (format or None, argv)
+    """
+    output_format = None
+    remaining = []
+    for arg in argv:
+        if arg.startswith('--output='):
+            output_format = arg.split('=', 1)[1].lower()
+        else:
+            remaining.append(arg)
+    if output_format is not None and output_format not in FORMATS:
+        raise SystemExit(f"--output must be one of {', '.join(FORMATS)}")
+    return output_format, remaining
+
+
+@contextmanager
+def machine_output(output_format):
+    """
+    Send records to stdout and everything else printed to stderr
+    """
+    global _emitter
+    _emitter = emitter(output_format, sys.stdout)
+    try:
+        with redirect_stdout(sys.stderr):
+            yield _emitter
+    finally:
+        _emitter = None
+
+
+def enabled():
+    return _emitter is not None
+
+
+def emit(record):
+    """
+    Write one record when machine readable output is on
+    """
+    if _emitter is not None:
+        _emitter.write(record)
@@ -0,0 +1,63 @@
+"""
+    Pool of authenticated zapi sessions across controllers and enterprises.
+
+    The targets file is a JSON list with one entry per controller/enterprise:
+        [
+            {
+                "name": "canary-acme",
+                "base_url": "https://zedcontrol.canary.zededa.net",
+                "username": "admin@acme.com",
+                "password": "...",
+                "auth_token": "..."      (optional, login is skipped when set)
+            }
+        ]
+"""
+
+import json
+
+from libs.bulk import parallel_map, DEFAULT_WORKERS
+
+
+class zpool(object):
+
+    def __init__(self, targets, workers=DEFAULT_WORKERS):
+
+        self.workers = workers
+        self.targets = {target['name']: target for target in targets}
+        self.sessions = {}
+        self.failed = {}
+        opened = parallel_map(self._open, list(self.targets), workers)
+        for name, result in opened.items():
+            if isinstance(result, Exception) or isinstance(result, str):
+                self.failed[name] = str(result)
+            else:
+                self.sessions[name] = result
+
+    @classmethod
+    def from_file(cls, file_name, workers=DEFAULT_WORKERS):
+
+        with open(file_name, 'r') as f:
+            return cls(json.load(f), workers)
+
+    def _open(self, name):
+
+        from libs.zapi import zapi
+
+        target = self.targets[name]
+        zsession = zapi(target['base_url'], target)
+        if not target.get('auth_token'):
+            status, token = zsession.login()
+            if status != 0:
+                return f"login failed: {token}"
+        return zsession
+
+    def run(self, method, *args):
+        """
+        Run method(zsession, *args) on every session concurrently,
+        returns {target name: result} including the targets that failed to log in
+        """
+        results = parallel_map(lambda name: method(self.sessions[name], *args),
+                               list(self.sessions), self.workers)
+        for name, reason in self.failed.items():
+            results[name] = RuntimeError(reason)
+        return dict(sorted(results.items()))
@@ -0,0 +1,205 @@
+"""
+    Profiling hooks for the command line tools.
+
+    --profile=<mode>[:<prefix>] runs a command under one profiler, they are
+    never combined since each one distorts what the others measure:
+        sample  stack sampler, every 1 ms; the lightest, its timings are
+                close to an unprofiled run
+                <prefix>.speedscope.json   sampled stacks of every thread (speedscope.app)
+                <prefix>.folded            the same stacks collapsed for flamegraph.pl
+        cpu     cProfile, exact call counts, but every Python call pays for
+                the tracing and short functions look slower than they are
+                <prefix>.pstats            cProfile statistics (snakeviz, pstats)
+        mem     tracemalloc, allocation sites; slows allocation heavy code
+                down several times
+                <prefix>.alloc.txt         top allocation sites
+    The prefix defaults to profile-<mode>.
+
+    Time spent inside phase() blocks (network waits, YAML parsing, builders)
+    is summed per phase as self time: a phase nested in another one is not
+    counted again in the outer phase, so the phase totals add up.
+"""
+
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+SAMPLE_INTERVAL = 0.001
+MODES = ('sample', 'cpu', 'mem')
+
+_lock = threading.Lock()
+# per thread stack of the open phases, [time spent in nested phases] each
+_open = threading.local()
+phases = defaultdict(lambda: [0.0, 0])
+
+
+@contextmanager
+def phase(name):
+    """
+    Add the wall time of the block, minus the nested phases, to the named phase
+    """
+    stack = _open.__dict__.setdefault('stack', [])
+    nested = [0.0]
+    stack.append(nested)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        with _lock:
+            entry = phases[name]
+            entry[0] += elapsed - nested[0]
+            entry[1] += 1
+
+
+def timed(name):
+    """
+    Decorator form of phase()
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def pop_profile_option(argv):
+    """
+    Remove --profile=<mode>[:<prefix>] from the command line,
+    returns ((mode, prefix) or None, argv)
+    """
+    profile = None
+    remaining = []
+    for arg in argv:
+        if arg.startswith('--profile='):
+            mode, _, prefix = arg.split('=', 1)[1].partition(':')
+            if mode not in MODES:
+                raise SystemExit(f"--profile must be one of {', '.join(MODES)}, optionally :<prefix>")
+            profile = (mode, prefix or f"profile-{mode}")
+        else:
+            remaining.append(arg)
+    return profile, remaining
+
+
+class _sampler(threading.Thread):
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = True
+
+    def run(self):
+
+        own = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+
+def _write_speedscope(stacks, file_name, name):
+
+    import json
+
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for stack, count in stacks.items():
+        sample = []
+        for entry in stack:
+            if entry not in index:
+                index[entry] = len(frames)
+                func, location = entry.rsplit(' (', 1)
+                path, line = location.rstrip(')').rsplit(':', 1)
+                frames.append({'name': func, 'file': path, 'line': int(line)})
+            sample.append(index[entry])
+        samples.append(sample)
+        weights.append(count * SAMPLE_INTERVAL)
+    profile = {
+        '$schema': "https://www.speedscope.app/file-format-schema.json",
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': "sampled",
+            'name': name,
+            'unit': "seconds",
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+        'name': name,
+    }
+    with open(file_name, 'w') as f:
+        json.dump(profile, f)
+
+
+def run_profiled(profile, method, *args):
+    """
+    Run method(*args) under the profiler of profile (mode, prefix) and write its reports
+    """
+    mode, prefix = profile
+    phases.clear()
+    if mode == 'cpu':
+        import cProfile
+        profiler = cProfile.Profile()
+    elif mode == 'mem':
+        import tracemalloc
+        tracemalloc.start(25)
+    else:
+        sampler = _sampler()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if mode == 'cpu':
+        profiler.enable()
+    elif mode == 'sample':
+        sampler.start()
+    try:
+        return method(*args)
+    finally:
+        if mode == 'cpu':
+            profiler.disable()
+        elif mode == 'sample':
+            sampler.running = False
+            sampler.join()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        summary = f"profile ({mode}): wall {wall:.3f}s, process cpu {cpu:.3f}s"
+        if mode == 'cpu':
+            profiler.dump_stats(f"{prefix}.pstats")
+        elif mode == 'mem':
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(f"{prefix}.alloc.txt", 'w') as f:
+                f.write(f"current {current} bytes, peak {peak} bytes\n")
+                for stat in snapshot.statistics('lineno')[:50]:
+                    f.write(f"{stat}\n")
+            summary += f", peak traced memory {peak / 1e6:.1f} MB"
+        else:
+            _write_speedscope(sampler.stacks, f"{prefix}.speedscope.json", " ".join(sys.argv))
+            with open(f"{prefix}.folded", 'w') as f:
+                for stack, count in sampler.stacks.items():
+                    f.write(";".join(stack) + f" {count}\n")
+
+        print(summary, file=sys.stderr)
+        for name, (elapsed, count) in sorted(phases.items(), key=lambda item: -item[1][0]):
+            print(f"profile: {name:<30} {elapsed:8.3f}s self in {count} calls", file=sys.stderr)
+        print(f"profile: reports written to {prefix}.*", file=sys.stderr)
@@ -0,0 +1,212 @@
+"""
+    Publish a batch of converted manifests as edge-apps.
+
+    ztool names the container images of a manifest by their full reference
+    (registry.example.com/team/api:1.2, postgres:13, ...), so a batch of
+    hundreds of apps mostly refers to the same few images. A reference with
+    a registry host must be in the registry of the shared datastore, its
+    imageRelUrl is the path below that host. Volume entries of ztool have an
+    empty imagename, they are not images and are left as they are. Publishing collects the distinct references of
+    the whole batch first, looks the existing images up with one list call,
+    creates each missing image once (concurrently) in the shared container
+    registry datastore, rewrites every manifest to the name of the shared
+    image and only then creates the edge-apps.
+
+    An image is reused only when an image with the same imageRelUrl exists
+    in the shared datastore, never by name alone.
+"""
+
+import json
+import re
+
+from libs.bulk import parallel_map, retry, DEFAULT_WORKERS
+from libs.output import emit
+from libs.schema import validate
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.\-]+')
+
+
+def image_name(reference):
+    """
+    Controller image name for a container image reference
+    """
+    return _UNSAFE.sub('-', reference).strip('-.')
+
+
+def read_manifests(file_names):
+    """
+    {app name: manifest} of the manifest files, the app name is the manifest name
+    """
+    manifests = {}
+    for file_name in file_names:
+        with open(file_name, 'r') as f:
+            manifest = json.load(f)
+        manifests[manifest['name']] = manifest
+    return manifests
+
+
+def references(manifests):
+    """
+    Distinct image references of all manifests, in first use order
+    """
+    seen = {}
+    for manifest in manifests.values():
+        for image in manifest.get('images', []):
+            if image.get('imagename'):
+                seen.setdefault(image['imagename'], None)
+    return list(seen)
+
+
+def relative_url(reference, fqdn):
+    """
+    imageRelUrl of a container image reference in the registry fqdn,
+    ValueError when the reference names another registry
+    """
+    host, _, path = reference.partition('/')
+    # like docker, the first segment is a registry host only when it looks like one
+    if not path or not ('.' in host or ':' in host or host == 'localhost'):
+        return reference
+    registry = re.sub(r'^[a-z]+://', '', fqdn or '').rstrip('/')
+    if host != registry:
+        raise ValueError(f"{reference} is not in the registry {registry} of the datastore")
+    return path
+
+
+def datastore(zsession, name, fqdn=None):
+    """
+    The shared datastore, created as a container registry when missing and fqdn is given
+    """
+    status, response = zsession.get_request(f"/api/v1/datastores/name/{name}")
+    if status == 0:
+        return response
+    if not fqdn:
+        print(f"datastore {name} not found, give --fqdn to create it")
+        return None
+    payload = {
+        'name': name,
+        'title': name,
+        'dsType': "DATASTORE_TYPE_CONTAINERREGISTRY",
+        'dsFQDN': fqdn,
+        'region': None,
+        'secret': {'apiKey': None, 'apiPasswd': None},
+    }
+    status, response = zsession.post_request("/api/v1/datastores", payload)
+    if status != 0 and zsession.last_status_code != 409:
+        print(f"create datastore {name} failed response {response}")
+        return None
+    status, response = zsession.get_request(f"/api/v1/datastores/name/{name}")
+    return response if status == 0 else None
+
+
+def imagePayload(reference, ds, arch="AMD64"):
+
+    name = image_name(reference)
+    return {
+        'name': name,
+        'title': name,
+        'datastoreId': ds['id'],
+        'imageRelUrl': relative_url(reference, ds.get('dsFQDN')),
+        'imageFormat': "CONTAINER",
+        'imageType': "IMAGE_TYPE_APPLICATION",
+        'imageArch': arch,
+    }
+
+
+def shareImages(zsession, refs, ds, arch="AMD64", workers=DEFAULT_WORKERS):
+    """
+    Make sure every reference has an image in the datastore ds,
+    returns {reference: image name or failure}
+    """
+    by_url = {}
+    for item in zsession.list_request("/api/v1/apps/images"):
+        if item.get('datastoreId') == ds['id'] and item.get('imageFormat') == "CONTAINER" \
+                and item.get('imageRelUrl'):
+            by_url[item['imageRelUrl']] = item['name']
+
+    shared, todo = {}, {}
+    for reference in refs:
+        try:
+            payload = imagePayload(reference, ds, arch)
+        except ValueError as e:
+            shared[reference] = e
+            print(f"image {reference}: failed: {e}")
+            emit({'op': "image create", 'reference': reference, 'status': f"failed: {e}"})
+            continue
+        if payload['imageRelUrl'] in by_url:
+            shared[reference] = by_url[payload['imageRelUrl']]
+        else:
+            todo[reference] = payload
+    print(f"{len(refs)} distinct images, {len(shared)} exist or are refused, {len(todo)} to create")
+
+    def create(reference):
+        payload = todo[reference]
+        errors = validate('image', payload)
+        if errors:
+            raise ValueError("; ".join(errors))
+        status, response = retry(zsession, zsession.post_request, "/api/v1/apps/images", payload)
+        if status != 0:
+            # 409: the name is taken by an image that is not this reference in ds
+            raise RuntimeError(response)
+        return payload['name']
+
+    def report(reference, result):
+        state = "created" if isinstance(result, str) else f"failed: {result}"
+        print(f"image {reference}: {state}")
+        emit({'op': "image create", 'reference': reference, 'status': state})
+
+    for reference, result in parallel_map(create, list(todo), workers, callback=report).items():
+        shared[reference] = result
+    return shared
+
+
+def rewrite(manifests, shared):
+    """
+    Point the images of every manifest at the shared image names, in place
+    """
+    for manifest in manifests.values():
+        for image in manifest.get('images', []):
+            if image.get('imagename'):
+                image['imagename'] = shared[image['imagename']]
+    return manifests
+
+
+def publish(zsession, manifests, ds, arch="AMD64", origin_type=None, workers=DEFAULT_WORKERS):
+    """
+    Share the images of the manifests in the datastore ds and create the edge-apps,
+    returns {app name: status}
+    """
+    shared = shareImages(zsession, references(manifests), ds, arch, workers)
+    result = {}
+    ready = {}
+    for name, manifest in manifests.items():
+        broken = [image['imagename'] for image in manifest.get('images', [])
+                  if image.get('imagename') and not isinstance(shared[image['imagename']], str)]
+        if broken:
+            result[name] = f"failed: image {', '.join(broken)} not created"
+            emit({'op': "edge-app create", 'name': name, 'status': result[name]})
+        else:
+            ready[name] = manifest
+    rewrite(ready, shared)
+
+    def create(name):
+        payload = {'name': name, 'title': name, 'manifestJSON': ready[name]}
+        if origin_type:
+            payload['originType'] = "ORIGIN_" + origin_type.upper()
+        errors = validate('edge-app', payload)
+        if errors:
+            raise ValueError("; ".join(errors))
+        status, response = retry(zsession, zsession.post_request, "/api/v1/apps", payload)
+        if status == 0:
+            return "created"
+        if zsession.last_status_code == 409:
+            return "exists"
+        raise RuntimeError(response)
+
+    def report(name, state):
+        state = state if isinstance(state, str) else f"failed: {state}"
+        print(f"edge-app {name}: {state}")
+        emit({'op': "edge-app create", 'name': name, 'status': state})
+
+    for name, state in parallel_map(create, list(ready), workers, callback=report).items():
+        result[name] = state if isinstance(state, str) else f"failed: {state}"
+    return result
@@ -0,0 +1,165 @@
+"""
+    Compact in-memory representation of controller object listings.
+
+    A response.json() dict per object costs several KB at fleet scale. The
+    record classes below keep only the queried fields in __slots__, intern
+    the low-cardinality strings (states, types, project and model ids) so
+    they are shared between objects, and keep the rest of the object as
+    zlib compressed JSON which is decoded only when .raw is read.
+
+    recordTable stores the same fields column by column for bulk operations
+    over a whole listing, e.g. counting states or selecting ids by project.
+    A wave rollout keeps the edge nodes it deploys to for hours, as slotted
+    rows of a table loaded without raw JSON (raw=False).
+"""
+
+import json
+import sys
+import zlib
+from collections import Counter
+
+_INTERNED = ('dsType', 'imageFormat', 'imageArch', 'datastoreId', 'projectId', 'modelId',
+             'adminState', 'runState', 'kind', 'appId', 'deviceId')
+
+
+def _field(obj, field):
+
+    if field == 'updateAvailable':
+        return bool((obj.get('parentDetail') or {}).get('updateAvailable'))
+    value = obj.get(field)
+    if field in _INTERNED and isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class record(object):
+
+    __slots__ = ('id', 'name', '_raw')
+    fields = ('id', 'name')
+
+    def __init__(self, obj):
+
+        for field in self.fields:
+            setattr(self, field, _field(obj, field))
+        self._raw = zlib.compress(json.dumps(obj, separators=(',', ':')).encode())
+
+    @property
+    def raw(self):
+        """
+        The full object as returned by the controller
+        """
+        return json.loads(zlib.decompress(self._raw))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{f}={getattr(self, f)!r}' for f in self.fields)})"
+
+
+class datastoreRecord(record):
+    __slots__ = ('dsType', 'dsFQDN')
+    fields = record.fields + __slots__
+
+
+class imageRecord(record):
+    __slots__ = ('datastoreId', 'imageFormat', 'imageArch')
+    fields = record.fields + __slots__
+
+
+class appRecord(record):
+    __slots__ = ('updateAvailable',)
+    fields = record.fields + __slots__
+
+
+class edgeNodeRecord(record):
+    __slots__ = ('serialno', 'projectId', 'modelId', 'adminState', 'runState')
+    fields = record.fields + __slots__
+
+
+class netinstRecord(record):
+    __slots__ = ('deviceId', 'projectId', 'kind')
+    fields = record.fields + __slots__
+
+
+class appInstanceRecord(record):
+    __slots__ = ('appId', 'deviceId', 'projectId', 'runState')
+    fields = record.fields + __slots__
+
+
+RECORDS = {
+    'datastore': datastoreRecord,
+    'image': imageRecord,
+    'app': appRecord,
+    'edge-node': edgeNodeRecord,
+    'netinst': netinstRecord,
+    'app-instance': appInstanceRecord,
+}
+
+
+class recordTable(object):
+    """
+    Column store of one object kind: one list per field, one compressed raw blob per row
+    """
+
+    def __init__(self, kind, raw=True):
+
+        self.kind = kind
+        self.fields = RECORDS[kind].fields
+        self.columns = {field: [] for field in self.fields}
+        self.keep_raw = raw
+        self._raw = []
+
+    def append(self, obj):
+
+        for field in self.fields:
+            self.columns[field].append(_field(obj, field))
+        if self.keep_raw:
+            self._raw.append(zlib.compress(json.dumps(obj, separators=(',', ':')).encode()))
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __iter__(self):
+        """
+        Full objects, decoded one at a time
+        """
+        return (self.raw(index) for index in range(len(self)))
+
+    def column(self, field):
+        return self.columns[field]
+
+    def where(self, field, value):
+        """
+        Row indexes whose field equals value
+        """
+        return [index for index, item in enumerate(self.columns[field]) if item == value]
+
+    def counts(self, field):
+        return Counter(self.columns[field])
+
+    def raw(self, index):
+        if not self.keep_raw:
+            raise ValueError(f"{self.kind} table was loaded without raw objects")
+        return json.loads(zlib.decompress(self._raw[index]))
+
+    def row(self, index):
+        """
+        Row as a record object
+        """
+        row = RECORDS[self.kind].__new__(RECORDS[self.kind])
+        for field in self.fields:
+            setattr(row, field, self.columns[field][index])
+        row._raw = self._raw[index] if self.keep_raw else None
+        return row
+
+
+def load(zsession, kind, url=None, raw=True, keep=None, **kwargs):
+    """
+    recordTable of every object of kind for which keep(obj) is true, filled
+    page by page from the list API (url, default the list url of kind)
+    """
+    from libs.inventory import KINDS
+
+    table = recordTable(kind, raw)
+    for obj in zsession.list_request(url or KINDS[kind][0], **kwargs):
+        if keep is None or keep(obj):
+            table.append(obj)
+    return table
@@ -1,5 +1,6 @@
 import json
 import uuid
+from libs.schema import validate
 
 
 def constructDs(args):
@@ -44,6 +45,23 @@ def constructDs(args):
     return 0, payload
 
 
+def datastoreCreate(zsession, args):
+
+    status, payload = constructDs(args)
+    if status != 0:
+        print("Construct payload for Datastore failed")
+        return 1
+    errors = validate('datastore', payload)
+    if errors:
+        print("Datastore payload is invalid: " + "; ".join(errors))
+        return 1
+    status, response = zsession.post_request("/api/v1/datastores", payload)
+    if status != 0:
+        print(f"create datastore {args['<name>']} failed response {response}")
+        return 1
+    return 0
+
+
 def imageCreate(args, dsId):
     print("=" * 100)
     zmethod = "Image Create global object"
@@ -111,6 +129,11 @@ def edgeAppCreate(zsession, args):
     if '--description' in args:
         payload['description'] = args['--description']
 
+    errors = validate('edge-app', payload)
+    if errors:
+        print(f"edge-app {args['<name>']} payload is invalid: " + "; ".join(errors))
+        return 1
+
     status, response = zsession.post_request(createUrl, payload)
     if status != 0:
         print(f"create edge-app {args['<name>']} failed response {response}")
@@ -232,5 +255,15 @@ def edgeAppRefresh(zsession, args):
         importPayload["bundleImport"]["bundleConfig"][0]["parentBundleId"] = parentID
         importPayload["jobName"] = jName
         impStatus, impResponse = zsession.put_request(importUrl, importPayload)
+        if impStatus != 0:
+            print(f"Import edge-app {args['<name>']} failed response {impResponse}")
+            return 1
+        if args.get('--wait'):
+            from libs.jobs import jobTracker
+            result = jobTracker(zsession).wait([jName])[jName]
+            if isinstance(result, Exception):
+                print(f"Import job {jName} failed {result}")
+                return 1
+            print(f"Import job {jName} finished with {result.get('status')}")
 
     return 0
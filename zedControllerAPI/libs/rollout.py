@@ -0,0 +1,191 @@
+"""
+    Wave based rollout of an edge-app to many edge nodes.
+
+    The nodes are split in waves (e.g. "1,5%,25%" deploys to 1 node, then
+    5% and 25% of the nodes, then the rest). In each wave the app instances
+    are created concurrently, then their run state is polled until every
+    instance is online, in error or the wave times out. The next wave only
+    starts when the failure rate of the wave is within max_failure, otherwise
+    the rollout pauses; running it again resumes, instances which already
+    exist are not created again.
+"""
+
+import time
+
+from libs.bulk import parallel_map, retry, DEFAULT_WORKERS
+from libs.output import emit
+from libs.records import load
+
+ONLINE = "RUN_STATE_ONLINE"
+FAILED_STATES = ("RUN_STATE_ERROR", "RUN_STATE_HALTED")
+
+
+def split_waves(nodes, waves):
+    """
+    Split nodes following a comma separated list of counts or percentages,
+    whatever is left over makes the last wave
+    """
+    total = len(nodes)
+    result = []
+    start = 0
+    for size in filter(None, (waves or "").split(',')):
+        size = size.strip()
+        if size.endswith('%'):
+            count = max(1, round(total * float(size[:-1]) / 100))
+        else:
+            count = int(size)
+        result.append(nodes[start:start + count])
+        start += count
+        if start >= total:
+            break
+    if start < total:
+        result.append(nodes[start:])
+    return [wave for wave in result if wave]
+
+
+def instancePayload(app, node, netinst):
+
+    manifest = app.get('manifestJSON') or {}
+    payload = {
+        'name': f"{app['name']}-{node.name}",
+        'title': f"{app['name']}-{node.name}",
+        'appId': app['id'],
+        'deviceId': node.id,
+        'projectId': node.projectId,
+        'activate': True,
+        'drives': [],
+        'interfaces': [],
+    }
+    for image in manifest.get('images', []):
+        payload['drives'].append({
+            'imagename': image.get('imagename', ""),
+            'maxsize': image.get('maxsize', "0"),
+            'preserve': image.get('preserve', False),
+            'target': image.get('target', ""),
+            'drvtype': image.get('drvtype', ""),
+            'readonly': image.get('readonly', False),
+            'cleartext': image.get('cleartext', False),
+            'ignorepurge': image.get('ignorepurge', True),
+            'volumelabel': image.get('volumelabel', ""),
+            'mountpath': image.get('mountpath', ""),
+        })
+    for interface in manifest.get('interfaces', []):
+        payload['interfaces'].append({
+            'intfname': interface['name'],
+            'netinstname': "" if interface.get('directattach') else netinst,
+            'directattach': interface.get('directattach', False),
+            'privateip': False,
+            'acls': interface.get('acls', []),
+        })
+    return payload
+
+
+class rollout(object):
+
+    def __init__(self, zsession, app_name, netinst, workers=DEFAULT_WORKERS,
+                 max_failure=10.0, wave_timeout=1800, poll_interval=10):
+
+        self.zsession = zsession
+        self.app_name = app_name
+        self.netinst = netinst
+        self.workers = workers
+        self.max_failure = max_failure
+        self.wave_timeout = wave_timeout
+        self.poll_interval = poll_interval
+        self.state = {}
+
+    def _create(self, node):
+
+        name = f"{self.app['name']}-{node.name}"
+        if name in self.instances:
+            return self.instances[name]
+
+        payload = instancePayload(self.app, node, self.netinst)
+        status, response = retry(self.zsession, self.zsession.post_request,
+                                 "/api/v1/apps/instances", payload)
+        if status != 0 and self.zsession.last_status_code != 409:
+            raise RuntimeError(f"create failed {response}")
+        status, response = self.zsession.get_request(f"/api/v1/apps/instances/name/{name}")
+        if status != 0:
+            raise RuntimeError(f"get failed {response}")
+        return response['id']
+
+    def _run_state(self, instance_id):
+
+        status, response = self.zsession.get_request(f"/api/v1/apps/instances/id/{instance_id}/status")
+        if status != 0:
+            return None
+        return response.get('runState')
+
+    def _wait(self, wave_ids):
+        """
+        Poll the wave until every instance settled, backing off while nothing changes
+        """
+        pending = dict(wave_ids)
+        interval = self.poll_interval
+        deadline = time.time() + self.wave_timeout
+        while pending and time.time() < deadline:
+            states = parallel_map(self._run_state, list(pending.values()), self.workers)
+            settled = 0
+            for node_name, instance_id in list(pending.items()):
+                run_state = states.get(instance_id)
+                if run_state == ONLINE or run_state in FAILED_STATES:
+                    self.state[node_name] = run_state
+                    del pending[node_name]
+                    settled += 1
+                elif isinstance(run_state, str):
+                    self.state[node_name] = run_state
+            print(f"  {len(wave_ids) - len(pending)}/{len(wave_ids)} settled")
+            if pending:
+                interval = self.poll_interval if settled else min(interval * 2, 120)
+                time.sleep(interval)
+        for node_name in pending:
+            self.state[node_name] = "timeout"
+
+    def run(self, node_names, waves):
+        """
+        Deploy to the nodes wave by wave, returns 0 when every wave passed
+        """
+        status, self.app = self.zsession.get_request(f"/api/v1/apps/name/{self.app_name}")
+        if status != 0:
+            print(f"Get edge-app {self.app_name} failed response {self.app}")
+            return 1
+
+        wanted = set(node_names)
+        # slotted rows with only the fields a rollout needs, kept until the last wave
+        devices = load(self.zsession, 'edge-node', raw=False, keep=lambda node: node['name'] in wanted)
+        nodes = [devices.row(index) for index in range(len(devices))]
+        missing = wanted - {node.name for node in nodes}
+        if missing:
+            print(f"unknown edge nodes: {', '.join(sorted(missing))}")
+        prefix = f"{self.app['name']}-"
+        self.instances = {item['name']: item['id'] for item in
+                          self.zsession.list_request("/api/v1/apps/instances")
+                          if item['name'].startswith(prefix)}
+
+        order = {name: index for index, name in enumerate(node_names)}
+        nodes.sort(key=lambda node: order[node.name])
+        plan = split_waves(nodes, waves)
+        for number, wave in enumerate(plan, 1):
+            print(f"wave {number}/{len(plan)}: {len(wave)} nodes")
+            by_name = {node.name: node for node in wave}
+            created = parallel_map(lambda name: self._create(by_name[name]), list(by_name), self.workers)
+            wave_ids = {}
+            for node_name, result in created.items():
+                if isinstance(result, Exception):
+                    self.state[node_name] = f"failed: {result}"
+                else:
+                    wave_ids[node_name] = result
+            self._wait(wave_ids)
+
+            for name in by_name:
+                emit({'op': "deploy", 'wave': number, 'node': name, 'status': self.state.get(name)})
+            failed = [name for name in by_name if self.state.get(name) != ONLINE]
+            failure_rate = 100.0 * len(failed) / len(wave)
+            print(f"wave {number}: {len(wave) - len(failed)} online, {len(failed)} not online"
+                  f" ({failure_rate:.1f}% failure)")
+            if failure_rate > self.max_failure:
+                print(f"failure rate above {self.max_failure}%, rollout paused after wave {number}."
+                      f" Fix the failing nodes and run the same command again to resume.")
+                return 1
+        return 0
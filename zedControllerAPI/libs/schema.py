@@ -0,0 +1,330 @@
+"""
+    Local validation of zedcontrol API payloads.
+
+    Schemas are plain dicts which are compiled once into nested check
+    functions, so validating thousands of payloads only walks the data.
+
+    Schema keys:
+        type      python type (or tuple of types) of the value
+        nullable  None is accepted
+        const     exact value
+        enum      list of accepted values
+        pattern   regex a string must match
+        minlen    minimum length of a string or list
+        required  dict of key: schema that must be present in a dict
+        optional  dict of key: schema checked when present
+        items     schema of every entry of a list
+"""
+
+import json
+import re
+
+_STR = {'type': str}
+_NAME = {'type': str, 'minlen': 1, 'pattern': r'^[A-Za-z0-9][A-Za-z0-9_.\-]*$'}
+_BOOL = {'type': bool}
+_ORIGIN = {'type': str, 'enum': ["ORIGIN_LOCAL", "ORIGIN_GLOBAL"]}
+
+_IMAGE_ENTRY = {
+    'type': dict,
+    'required': {
+        'imagename': _STR,
+        'maxsize': _STR,
+        'preserve': _BOOL,
+        'target': _STR,
+        'drvtype': _STR,
+        'readonly': _BOOL,
+        'volumelabel': _STR,
+        'ignorepurge': _BOOL,
+        'cleartext': _BOOL,
+        'mountpath': _STR,
+    },
+}
+
+_ACL = {
+    'type': dict,
+    'required': {
+        'matches': {
+            'type': list,
+            'minlen': 1,
+            'items': {
+                'type': dict,
+                'required': {
+                    'type': {'type': str, 'enum': ["protocol", "lport", "ip", "host", "fport", "adapter"]},
+                    'value': _STR,
+                },
+            },
+        },
+        'actions': {'type': list, 'items': {'type': dict}},
+        'name': _STR,
+    },
+}
+
+_INTERFACE = {
+    'type': dict,
+    'required': {
+        'name': _NAME,
+        'directattach': _BOOL,
+        'acls': {'type': list, 'items': _ACL},
+    },
+}
+
+_VARIABLE = {
+    'type': dict,
+    'required': {
+        'name': _STR,
+        'label': _STR,
+        'required': _BOOL,
+        'format': {'type': str, 'enum': ["VARIABLE_FORMAT_TEXT", "VARIABLE_FORMAT_PASSWORD",
+                                         "VARIABLE_FORMAT_FILE"]},
+        'encode': {'type': str, 'enum': ["FILE_ENCODING_UNSPECIFIED", "FILE_ENCODING_BASE64"]},
+    },
+}
+
+_CUSTOM_CONFIG = {
+    'type': dict,
+    'required': {
+        'name': _STR,
+        'fieldDelimiter': _STR,
+        'template': _STR,
+        'variableGroups': {
+            'type': list,
+            'items': {
+                'type': dict,
+                'required': {'name': _STR, 'variables': {'type': list, 'items': _VARIABLE}},
+            },
+        },
+    },
+}
+
+SCHEMAS = {
+    'pod-manifest': {
+        'type': dict,
+        'required': {
+            'acKind': {'const': "PodManifest"},
+            'acVersion': {'const': "1.2.0"},
+            'name': _NAME,
+            'owner': {'type': dict},
+            'desc': {'type': dict, 'required': {'appCategory': _STR}},
+            'images': {'type': list, 'minlen': 1, 'items': _IMAGE_ENTRY},
+            'interfaces': {'type': list, 'items': _INTERFACE},
+            'vmmode': {'type': str, 'enum': ["HV_PV", "HV_HVM", "HV_FML", "HV_NOHYPER"]},
+            'enablevnc': _BOOL,
+            'resources': {
+                'type': list,
+                'items': {'type': dict, 'required': {'name': _STR, 'value': _STR}},
+            },
+            'configuration': {'type': dict, 'optional': {'customConfig': _CUSTOM_CONFIG}},
+            'appType': {'const': "APP_TYPE_CONTAINER"},
+            'deploymentType': _STR,
+        },
+    },
+    'manifest': {
+        'type': dict,
+        'required': {
+            'acKind': {'type': str, 'enum': ["PodManifest", "VMManifest"]},
+            'acVersion': _STR,
+            'name': _NAME,
+            'images': {'type': list, 'items': {'type': dict, 'required': {'imagename': _STR}}},
+        },
+    },
+    'datastore': {
+        'type': dict,
+        'required': {
+            'name': _NAME,
+            'title': _STR,
+            'dsType': {'type': str, 'enum': ["DATASTORE_TYPE_HTTP", "DATASTORE_TYPE_HTTPS",
+                                             "DATASTORE_TYPE_AWSS3", "DATASTORE_TYPE_AZUREBLOB",
+                                             "DATASTORE_TYPE_CONTAINERREGISTRY"]},
+            'dsFQDN': {'type': str, 'minlen': 1},
+            'secret': {'type': dict},
+        },
+        'optional': {
+            'dsPath': {'type': str, 'nullable': True},
+            'region': {'type': str, 'nullable': True},
+            'originType': _ORIGIN,
+            'description': {'type': str, 'nullable': True},
+        },
+    },
+    'image': {
+        'type': dict,
+        'required': {
+            'name': _NAME,
+            'title': _STR,
+            'datastoreId': {'type': str, 'minlen': 1},
+            'imageFormat': {'type': str, 'enum': ["QCOW2", "RAW", "QCOW", "VMDK", "VHDX",
+                                                  "CONTAINER", "ISO"]},
+            'imageType': {'type': str, 'enum': ["IMAGE_TYPE_APPLICATION", "IMAGE_TYPE_EVE",
+                                                "IMAGE_TYPE_ARTIFACT"]},
+            'imageArch': {'type': str, 'enum': ["AMD64", "ARM64"]},
+        },
+        'optional': {
+            'imageRelUrl': _STR,
+            'originType': _ORIGIN,
+            'description': {'type': str, 'nullable': True},
+        },
+    },
+    'edge-app': {
+        'type': dict,
+        'required': {
+            'name': _NAME,
+            'title': _STR,
+            'manifestJSON': {'type': dict, 'required': {'acKind': _STR, 'name': _NAME}},
+        },
+        'optional': {
+            'originType': _ORIGIN,
+            'description': {'type': str, 'nullable': True},
+        },
+    },
+    'user': {
+        'type': dict,
+        'required': {
+            'username': {'type': str, 'minlen': 1},
+            'type': {'type': str, 'enum': ["AUTH_TYPE_LOCAL", "AUTH_TYPE_OAUTH"]},
+            'email': {'type': str, 'pattern': r'^[^@\s]+@[^@\s]+\.[^@\s]+$'},
+            'fullName': _STR,
+        },
+        'optional': {
+            'roleId': _STR,
+            'timeZone': _STR,
+            'phone': _STR,
+        },
+    },
+}
+
+_compiled = {}
+
+
+def _compile(schema):
+
+    checks = []
+    if 'const' in schema:
+        const = schema['const']
+
+        def check_const(value, path, errors):
+            if value != const:
+                errors.append(f"{path}: expected {const!r} got {value!r}")
+                return False
+            return True
+        checks.append(check_const)
+
+    if 'type' in schema:
+        value_type = schema['type']
+        nullable = schema.get('nullable', False)
+
+        def check_type(value, path, errors):
+            if value is None and nullable:
+                return False
+            # bool is an int subclass, never accept it for numbers
+            if not isinstance(value, value_type) or (isinstance(value, bool) and value_type is not bool):
+                errors.append(f"{path}: expected {getattr(value_type, '__name__', value_type)}"
+                              f" got {type(value).__name__}")
+                return False
+            return True
+        checks.append(check_type)
+
+    if 'enum' in schema:
+        allowed = frozenset(schema['enum'])
+
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                errors.append(f"{path}: {value!r} not one of {sorted(allowed)}")
+        checks.append(check_enum)
+
+    if 'minlen' in schema:
+        minlen = schema['minlen']
+
+        def check_minlen(value, path, errors):
+            if len(value) < minlen:
+                errors.append(f"{path}: needs at least {minlen} entries" if isinstance(value, list)
+                              else f"{path}: must not be empty")
+        checks.append(check_minlen)
+
+    if 'pattern' in schema:
+        regex = re.compile(schema['pattern'])
+
+        def check_pattern(value, path, errors):
+            if value and not regex.match(value):
+                errors.append(f"{path}: {value!r} does not match {regex.pattern}")
+        checks.append(check_pattern)
+
+    required = {key: _compile(sub) for key, sub in schema.get('required', {}).items()}
+    optional = {key: _compile(sub) for key, sub in schema.get('optional', {}).items()}
+    if required or optional:
+        def check_keys(value, path, errors):
+            for key, check in required.items():
+                if key not in value:
+                    errors.append(f"{path}.{key}: missing")
+                else:
+                    check(value[key], f"{path}.{key}", errors)
+            for key, check in optional.items():
+                if key in value:
+                    check(value[key], f"{path}.{key}", errors)
+        checks.append(check_keys)
+
+    if 'items' in schema:
+        item_check = _compile(schema['items'])
+
+        def check_items(value, path, errors):
+            for index, item in enumerate(value):
+                item_check(item, f"{path}[{index}]", errors)
+        checks.append(check_items)
+
+    def check(value, path, errors):
+        # type and const failures stop the deeper checks of that value
+        for step in checks:
+            if step(value, path, errors) is False:
+                return
+    return check
+
+
+def validator(kind):
+    """
+    Compiled check function of a schema, built on first use
+    """
+    if kind not in _compiled:
+        _compiled[kind] = _compile(SCHEMAS[kind])
+    return _compiled[kind]
+
+
+def validate(kind, payload):
+    """
+    Validate payload against the named schema and return the list of errors
+    """
+    errors = []
+    validator(kind)(payload, kind, errors)
+    if kind == 'edge-app' and not errors and payload['manifestJSON']['acKind'] == "PodManifest":
+        validator('pod-manifest')(payload['manifestJSON'], "edge-app.manifestJSON", errors)
+    return errors
+
+
+def validate_files(file_names):
+    """
+    Validate many manifest or payload JSON files in one pass,
+    returns {file_name: errors} for the invalid ones
+    """
+    invalid = {}
+    for file_name in file_names:
+        try:
+            with open(file_name, 'r') as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            invalid[file_name] = [str(e)]
+            continue
+
+        if isinstance(payload, dict) and payload.get('acKind') == "PodManifest":
+            errors = validate('pod-manifest', payload)
+        elif isinstance(payload, dict) and 'acKind' in payload:
+            errors = validate('manifest', payload)
+        elif isinstance(payload, dict) and 'manifestJSON' in payload:
+            errors = validate('edge-app', payload)
+        elif isinstance(payload, dict) and 'dsType' in payload:
+            errors = validate('datastore', payload)
+        elif isinstance(payload, dict) and 'datastoreId' in payload:
+            errors = validate('image', payload)
+        elif isinstance(payload, dict) and 'username' in payload:
+            errors = validate('user', payload)
+        else:
+            errors = ["unknown payload kind"]
+        if errors:
+            invalid[file_name] = errors
+    return invalid
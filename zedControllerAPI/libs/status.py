@@ -0,0 +1,113 @@
+"""
+    Fleet status poller.
+
+    Edge-node and app-instance states are read through the paginated status
+    list APIs, so one round costs a request per page instead of one per
+    object. Kinds are polled concurrently, only state changes are emitted,
+    and the poll interval backs off while nothing changes. The last seen
+    states can be saved to a file so that a later run only reports what
+    changed since.
+"""
+
+import json
+import os
+import time
+from collections import Counter
+
+from libs.bulk import parallel_map
+from libs.output import emit
+
+# kind: (status list url, state field)
+STATUS_KINDS = {
+    'edge-node': ("/api/v1/devices/status", 'runState'),
+    'app-instance': ("/api/v1/apps/instances/status", 'runState'),
+}
+
+
+class poller(object):
+
+    def __init__(self, zsession, kinds=None, targets=None, state_file=None,
+                 interval=10, max_interval=120, page_size=500):
+
+        self.zsession = zsession
+        self.kinds = kinds or list(STATUS_KINDS)
+        self.targets = targets or {}
+        self.state_file = state_file
+        self.interval = interval
+        self.max_interval = max_interval
+        self.page_size = page_size
+        self.last = {kind: {} for kind in self.kinds}
+        if state_file and os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                self.last.update(json.load(f))
+
+    def _poll_kind(self, kind):
+
+        url, field = STATUS_KINDS[kind]
+        return {item['name']: item.get(field) or "UNKNOWN"
+                for item in self.zsession.list_request(url, page_size=self.page_size)}
+
+    def poll(self):
+        """
+        One polling round, returns [(kind, name, old state, new state)] for what changed
+        """
+        current = parallel_map(self._poll_kind, self.kinds, len(self.kinds))
+        changes = []
+        for kind in self.kinds:
+            states = current[kind]
+            if isinstance(states, Exception):
+                print(f"poll {kind} failed {states}")
+                continue
+            last = self.last[kind]
+            for name, state in states.items():
+                if last.get(name) != state:
+                    changes.append((kind, name, last.get(name), state))
+            for name in set(last) - set(states):
+                changes.append((kind, name, last[name], None))
+            self.last[kind] = states
+        if self.state_file:
+            with open(self.state_file, 'w') as f:
+                json.dump(self.last, f)
+        return changes
+
+    def summary(self, stragglers=10):
+        """
+        Count of objects per state, and the objects not yet in their target state
+        """
+        lines = []
+        for kind in self.kinds:
+            counts = Counter(self.last[kind].values())
+            lines.append(f"{kind}: " + ", ".join(f"{state} {count}" for state, count in counts.most_common()))
+            target = self.targets.get(kind)
+            if target:
+                behind = sorted(name for name, state in self.last[kind].items() if state != target)
+                lines.append(f"  {len(behind)} not {target}"
+                             + (f": {', '.join(behind[:stragglers])}" if behind else ""))
+                if len(behind) > stragglers:
+                    lines[-1] += ", ..."
+        return "\n".join(lines)
+
+    def done(self):
+
+        return all(self.last[kind] and all(state == target for state in self.last[kind].values())
+                   for kind, target in self.targets.items())
+
+    def watch(self, timeout=None, report=print):
+        """
+        Poll until every object reached its target state or timeout seconds elapsed,
+        returns 0 when the targets were reached
+        """
+        deadline = time.time() + timeout if timeout else None
+        interval = self.interval
+        while True:
+            changes = self.poll()
+            for kind, name, old, new in changes:
+                report(f"{kind} {name}: {old or '-'} -> {new or 'removed'}")
+                emit({'kind': kind, 'name': name, 'old': old, 'new': new, 'time': time.time()})
+            print(self.summary())
+            if self.targets and self.done():
+                return 0
+            if deadline and time.time() >= deadline:
+                return 1
+            interval = self.interval if changes else min(interval * 2, self.max_interval)
+            time.sleep(interval if not deadline else max(0, min(interval, deadline - time.time())))
@@ -0,0 +1,127 @@
+"""
+    Dependency ordered bulk delete.
+
+    Objects are deleted tier by tier, app instances first and enterprises
+    last, so nothing is deleted while another object still refers to it.
+    Inside a tier every delete runs concurrently, and the next tier only
+    starts once every deleted object of the tier is gone (the controller
+    accepts deletes before it has finished them). Objects are selected with
+    one list call per kind, filtered by name prefix. Selecting everything
+    takes an explicit prefix of None, an empty prefix is refused. The user
+    running the teardown and its enterprise are never selected.
+"""
+
+import threading
+import time
+
+from libs.bulk import parallel_map, retry, DEFAULT_WORKERS
+from libs.output import emit
+
+# dependency order: (kind, list url, delete url)
+TIERS = [
+    ('app-instance', "/api/v1/apps/instances", "/api/v1/apps/instances/id/{}"),
+    ('app', "/api/v1/apps", "/api/v1/apps/id/{}"),
+    ('image', "/api/v1/apps/images", "/api/v1/apps/images/id/{}"),
+    ('datastore', "/api/v1/datastores", "/api/v1/datastores/id/{}"),
+    ('user', "/api/v1/users", "/api/v1/users/id/{}"),
+    ('enterprise', "/api/v1/enterprises", "/api/v1/enterprises/id/{}"),
+]
+DEFAULT_KINDS = ('app-instance', 'app', 'image', 'datastore')
+# name field of the list entries, users are named by username
+NAME_FIELDS = {'user': 'username'}
+GONE_TIMEOUT = 300
+
+
+def plan(zsession, prefix, kinds=DEFAULT_KINDS):
+    """
+    [(kind, [(id, name)])] of the objects to delete, in deletion order.
+    prefix None selects every object of the kinds.
+    """
+    if prefix is not None and not prefix.strip():
+        raise ValueError("empty --prefix would select every object, use --all")
+    keep = set()
+    if 'enterprise' in kinds:
+        status, response = zsession.get_request(f"/api/v1/users/name/{zsession.username}")
+        if status != 0 or not response.get('enterpriseId'):
+            raise ValueError(f"enterprise of {zsession.username} not found, refusing to delete enterprises")
+        keep.add(response['enterpriseId'])
+
+    selected = []
+    for kind, list_url, delete_url in TIERS:
+        if kind not in kinds:
+            continue
+        field = NAME_FIELDS.get(kind, 'name')
+        objects = [(item['id'], item[field]) for item in zsession.list_request(list_url)
+                   if (prefix is None or item[field].startswith(prefix)) and item['id'] not in keep]
+        if kind == 'user':
+            # never delete the account running the teardown
+            objects = [(obj_id, name) for obj_id, name in objects if name != zsession.username]
+        selected.append((kind, objects))
+    return selected
+
+
+def wait_gone(zsession, url, ids, timeout=GONE_TIMEOUT, workers=DEFAULT_WORKERS, interval=2.0):
+    """
+    Poll the objects until a GET returns 404, returns the ids still present after timeout
+    """
+    def present(obj_id):
+        zsession.last_status_code = None
+        zsession.get_request(url.format(obj_id))
+        return zsession.last_status_code != 404
+
+    deadline = time.time() + timeout
+    pending = list(ids)
+    while pending:
+        result = parallel_map(present, pending, workers)
+        # a failed poll counts as still present
+        pending = [obj_id for obj_id in pending if result[obj_id] is not False]
+        if not pending or time.time() >= deadline:
+            break
+        time.sleep(min(interval, max(0.0, deadline - time.time())))
+        interval = min(interval * 1.5, 30.0)
+    return pending
+
+
+def teardown(zsession, selected, workers=DEFAULT_WORKERS, timeout=GONE_TIMEOUT):
+    """
+    Delete the planned objects, returns {kind: (deleted, failed names)}.
+    Stops after a tier whose objects are not all gone within timeout seconds.
+    """
+    delete_urls = {kind: delete_url for kind, list_url, delete_url in TIERS}
+    summary = {}
+    for kind, objects in selected:
+        names = dict(objects)
+        done = []
+        lock = threading.Lock()
+
+        def delete(obj_id):
+            status, response = retry(zsession, zsession.delete_request, delete_urls[kind].format(obj_id))
+            # already gone counts as deleted
+            if status != 0 and zsession.last_status_code != 404:
+                raise RuntimeError(response)
+            return 0
+
+        def progress(obj_id, result):
+            with lock:
+                done.append(obj_id)
+                count = len(done)
+            state = "deleted" if result == 0 else f"FAILED {result}"
+            print(f"[{kind} {count}/{len(objects)}] {names[obj_id]} {state}")
+            emit({'op': "delete", 'kind': kind, 'id': obj_id, 'name': names[obj_id],
+                  'status': "deleted" if result == 0 else f"failed: {result}"})
+
+        results = parallel_map(delete, list(names), workers, callback=progress)
+        failed = sorted(names[obj_id] for obj_id, result in results.items() if result != 0)
+        accepted = [obj_id for obj_id, result in results.items() if result == 0]
+        remaining = wait_gone(zsession, delete_urls[kind], accepted, timeout, workers)
+        for obj_id in remaining:
+            print(f"[{kind}] {names[obj_id]} still present after {timeout}s")
+            emit({'op': "delete", 'kind': kind, 'id': obj_id, 'name': names[obj_id],
+                  'status': f"failed: still present after {timeout}s"})
+        failed = sorted(failed + [names[obj_id] for obj_id in remaining])
+        summary[kind] = (len(accepted) - len(remaining), failed)
+        if failed:
+            # the next tier would delete what these objects still refer to
+            print(f"{kind} not all deleted, later tiers are left alone")
+            break
+    return summary
@@ -1,5 +1,75 @@
-from zapi import zapi
+from libs.schema import validate
 
-class user(object):
-    def __init__(self, **kwargs):
-        pass
+
+def getRoleId(zsession, role):
+
+    status, response = zsession.get_request(f"/api/v1/roles/name/{role}")
+    if status != 0:
+        print(f"GET request to get ID of {role} failed")
+        return None
+    return response['id']
+
+
+def createUserCredentials(zsession, username, password):
+
+    payload = {
+        'owner': username,
+        'type': 'CREDENTIAL_TYPE_PASSWORD',
+        'newCred': password
+    }
+    status, response = zsession.post_request('/api/v1/credentials', payload)
+    return status
+
+
+def userCreate(zsession, args):
+    print("=" * 100)
+    zmethod = "user create"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    payload = {}
+    payload['username'] = args['<name>']
+    if args['<type>'] == "Local":
+        payload['type'] = "AUTH_TYPE_LOCAL"
+    else:
+        payload['type'] = "AUTH_TYPE_OAUTH"
+    payload['email'] = args['--email']
+    if args.get('--role'):
+        payload['roleId'] = getRoleId(zsession, args['--role'])
+        if payload['roleId'] is None:
+            return 1
+    payload['fullName'] = args.get('--fullname') or args['<name>']
+    if args.get('--timezone'):
+        payload['timeZone'] = args['--timezone']
+    if args.get('--phone'):
+        payload['phone'] = args['--phone']
+
+    errors = validate('user', payload)
+    if errors:
+        print("User payload is invalid: " + "; ".join(errors))
+        return 1
+
+    status, response = zsession.post_request("/api/v1/users", payload)
+    if status != 0:
+        print(f"create user {args['<name>']} failed response {response}")
+        return 1
+    if args['<type>'] == "Local":
+        return createUserCredentials(zsession, args['<name>'], args['--password'])
+    return 0
+
+
+def userDelete(zsession, name):
+    print("=" * 100)
+    zmethod = "user Delete"
+    print(zmethod.center(70))
+    print("=" * 100)
+
+    status, response = zsession.get_request(f"/api/v1/users/name/{name}")
+    if status != 0:
+        print(f"Get user {name} failed response {response}")
+        return 1
+    status, response = zsession.delete_request(f"/api/v1/users/id/{response['id']}")
+    if status != 0:
+        print(f"Delete user {name} failed response {response}")
+        return 1
+    return 0
@@ -1,8 +1,19 @@
 import requests
 from requests import Session
 from requests.exceptions import ConnectionError
-import json, uuid
+import json, uuid, threading
 from os import environ
+from libs.profiling import phase
+
+
+class _timedSession(Session):
+    """
+    Session which books the time spent waiting on the controller to the network phase
+    """
+    def request(self, *args, **kwargs):
+        with phase('network'):
+            return super().request(*args, **kwargs)
+
 
 class zapi(object):
 
@@ -15,14 +26,49 @@ class zapi(object):
             self.auth_token = None
         self.username = config['username']
         self.password = config['password']
-        self.headers = {
+        self._local = threading.local()
+        # session and headers of the creating thread, other threads start from a copy
+        self._main_session = self._local.session = _timedSession()
+        self._main_headers = self._local.headers = {
             'content-type': 'application/json',
             'Authorization': "bearer {}".format(self.auth_token),
             'userAgent': 'sathiyadev-testing'
         }
-        self.session = Session()
         self.x_csrf_token = self._get_CSRF_token()
 
+    def _thread_state(self):
+        """
+        Session and headers of the calling thread. A requests session and the
+        headers it refreshes (X-CSRF-Token) must not be shared between threads,
+        so every thread gets its own, seeded with the cookies and headers of
+        the creating thread.
+        """
+        if not hasattr(self._local, 'session'):
+            session = _timedSession()
+            session.cookies.update(self._main_session.cookies)
+            self._local.headers = dict(self._main_headers)
+            self._local.session = session
+        return self._local
+
+    @property
+    def session(self):
+        return self._thread_state().session
+
+    @property
+    def headers(self):
+        return self._thread_state().headers
+
+    @property
+    def last_status_code(self):
+        """
+        HTTP status code of the last request made by the calling thread
+        """
+        return getattr(self._local, 'status_code', None)
+
+    @last_status_code.setter
+    def last_status_code(self, status_code):
+        self._local.status_code = status_code
+
     def _get_CSRF_token(self):
 
         request_id = uuid.uuid4()
@@ -76,6 +122,7 @@ class zapi(object):
             else:
                 response = self.session.get(url, headers=self.headers, params=params)
 
+            self.last_status_code = response.status_code
             print(f"Response Code: {response.status_code}")
             print(f"Response body: {response.json()}\n\n")
             if response.status_code != 200:
@@ -93,6 +140,29 @@ class zapi(object):
             return 1, str(e)
 
 
+    def list_request(self, url_extention, params=None, page_size=100):
+        """
+        Generator walking every page of a list API
+        and yielding the objects one at a time
+        """
+        page_params = dict(params or {})
+        page_params['next.pageSize'] = page_size
+        page_num = 1
+        while True:
+            page_params['next.pageNum'] = page_num
+            status, response = self.get_request(url_extention, page_params)
+            if status != 0:
+                raise RuntimeError(f"list {url_extention} page {page_num} failed {response}")
+
+            for item in response.get('list') or []:
+                yield item
+
+            total_pages = (response.get('next') or {}).get('totalPages', 1)
+            if page_num >= total_pages:
+                break
+            page_num += 1
+
+
     def put_request(self, url_extention, payload=None,retry=3):
 
         url = self.base_url + url_extention
@@ -108,6 +178,7 @@ class zapi(object):
             else:
                 response = self.session.put(url, headers=self.headers, data=json.dumps(payload))
 
+            self.last_status_code = response.status_code
             print(f"Response Code: {response.status_code}")
             print(f"Response body: {response.json()}\n")
             if response.status_code not in [200,202]:
@@ -143,6 +214,7 @@ class zapi(object):
                 response = self.session.post(url, headers=self.headers, data=json.dumps(payload),\
                                          files={'file': open('files', 'r')})
 
+            self.last_status_code = response.status_code
             print(f"Response Code: {response.status_code}")
             print(f"Response body: {response.json()}\n")
             if response.status_code == 409:
@@ -170,9 +242,10 @@ class zapi(object):
 
         try:
             response = self.session.delete(url, headers=self.headers)
-            print(f"Response code {response}")
-            print(f"Response Boby {rsponse.json}")
-            if response.status_code not in [200]:
+            self.last_status_code = response.status_code
+            print(f"Response Code: {response.status_code}")
+            print(f"Response body: {response.text}\n")
+            if response.status_code not in [200, 202]:
                 print("DELETE method to API {} failed".format(url))
                 return 1, response.text
 
@@ -181,7 +254,7 @@ class zapi(object):
         except ConnectionError as e:
             print("Connection error retry DELETE request")
             print("{}".format(e))
+            return 1, f"connection error: {e}"
         except Exception as e:
             print("Exception during DELETE to API {}".format(e))
             return 1, str(e)
-
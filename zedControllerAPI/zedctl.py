@@ -0,0 +1,126 @@
+usage = '''
+Single entry point for the zedcontrol example tools
+Usage:
+  zedctl.py api <args>...            same commands as apiHelper.py
+  zedctl.py enterprise <args>...     same commands as enterprise_manage.py
+  zedctl.py ztool <args>...          same commands as ../ztool/ztool.py
+  zedctl.py fanout <args>...         same commands as fanout.py
+  zedctl.py startup-time [--runs=<runs>] [--budget-ms=<budget-ms>]
+
+pip install -e . in this directory installs the zedctl command, -e keeps ztool
+(../ztool) reachable. Only the modules of the selected command are imported.
+startup-time measures the median cold start of every command, importing what a
+real run imports, lists the slowest imports and exits non zero when one is over
+budget.
+'''
+
+import os
+import sys
+
+STARTUP_BUDGET_MS = 150
+# modules imported by a real run of each command: its module, docopt and the session
+STARTUP_IMPORTS = {
+    'api': ('apiHelper', 'docopt', 'libs.zapi'),
+    'enterprise': ('enterprise_manage', 'docopt', 'libs.zapi'),
+    'fanout': ('fanout', 'docopt', 'libs.zapi', 'libs.pool', 'libs.resourceCreate', 'libs.user'),
+    'ztool': ('ztool', 'docopt', 'yaml'),
+}
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _ztool_main(argv):
+
+    # ztool is not part of the zedctl package, it runs from the repository checkout
+    ztool_dir = os.path.join(HERE, '..', 'ztool')
+    if not os.path.isfile(os.path.join(ztool_dir, 'ztool.py')):
+        print(f"ztool not found in {os.path.normpath(ztool_dir)}, install zedctl with pip install -e")
+        return 1
+    sys.path.insert(0, ztool_dir)
+    from ztool import main
+    return main(argv)
+
+
+def _api_main(argv):
+
+    from apiHelper import main
+    return main(argv)
+
+
+def _enterprise_main(argv):
+
+    from enterprise_manage import main
+    return main(argv)
+
+
+def _fanout_main(argv):
+
+    from fanout import main
+    return main(argv)
+
+
+COMMANDS = {
+    'api': _api_main,
+    'enterprise': _enterprise_main,
+    'fanout': _fanout_main,
+    'ztool': _ztool_main,
+}
+
+
+def startup_time(argv):
+    """
+    Median wall time of a fresh interpreter importing everything a real run of
+    each command imports (STARTUP_IMPORTS, --help alone skips requests and
+    libs.zapi), with the slowest imports of the last run from -X importtime
+    """
+    import subprocess
+    import time
+
+    options = dict(arg.lstrip('-').split('=', 1) for arg in argv if '=' in arg)
+    runs = int(options.get('runs', 10))
+    budget_ms = float(options.get('budget-ms', STARTUP_BUDGET_MS))
+    over_budget = 0
+    for command, modules in STARTUP_IMPORTS.items():
+        code = (f"import sys; sys.path.insert(0, {os.path.join(HERE, '..', 'ztool')!r}); "
+                f"import {', '.join(modules)}")
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, cwd=HERE)
+            samples.append((time.perf_counter() - start) * 1000)
+        if proc.returncode != 0:
+            print(f"{command:<12} import failed: {proc.stderr.strip().splitlines()[-1]}")
+            over_budget += 1
+            continue
+        median = sorted(samples)[len(samples) // 2]
+        verdict = "ok" if median <= budget_ms else "OVER BUDGET"
+        if median > budget_ms:
+            over_budget += 1
+        print(f"{command:<12} median {median:8.1f} ms  budget {budget_ms:.0f} ms  {verdict}")
+        # "import time: self [us] | cumulative | imported package", top level imports only
+        top = []
+        for line in proc.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[1].strip().isdigit() and not fields[2].startswith('  '):
+                top.append((int(fields[1]), fields[2].strip()))
+        for cumulative, module in sorted(top, reverse=True)[:3]:
+            print(f"{'':<12} {module:<30} {cumulative / 1000:8.1f} ms")
+    return 1 if over_budget else 0
+
+
+def main(argv=None):
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage)
+        return 0
+    if argv[0] == 'startup-time':
+        return startup_time(argv[1:])
+    if argv[0] not in COMMANDS:
+        print(usage)
+        return 1
+    return COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+    Benchmark for the ztool conversion.
+
+    Generates synthetic inputs of a chosen shape (services, ports per service,
+    env vars, volumes and configmap keys per container) and measures:
+        - conversion throughput: YAML ingestion plus convertToApp, apps/s
+        - peak traced memory of one conversion pass (tracemalloc)
+        - the time split over the YAML parser and the builders, taken from
+          the profiling phases (_build_custom_config, _build_interfaces, ...)
+
+    The result is a JSON report. Given a baseline report of the same shape,
+    every metric that got worse by more than --tolerance percent is listed
+    and the exit status is 1, so CI can fail on converter regressions.
+    kompose is an external binary and is not part of the measurement, use
+    "generate --format=compose" to produce inputs for it.
+"""
+
+usage = '''
+Benchmark ztool conversion on synthetic inputs
+
+Usage:
+    bench.py generate <out-dir> [--format=<k8s|compose>] [options]
+    bench.py run [--report=<report.json>] [--baseline=<baseline.json>] [--tolerance=<percent>] [--repeat=<repeat>] [options]
+
+Options:
+    --services=<n>        services (one Deployment, Service and ConfigMap each) [default: 200]
+    --ports=<n>           ports per service [default: 4]
+    --env=<n>             env vars per container [default: 20]
+    --volumes=<n>         volume mounts per container [default: 2]
+    --configmap-keys=<n>  configmap keys per service, 0 for plain env [default: 10]
+'''
+
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import profiling
+import ztool
+
+SHAPE = ('services', 'ports', 'env', 'volumes', 'configmap-keys')
+# metric: True when higher is better
+METRICS = {'apps_per_second': True, 'peak_bytes': False}
+
+
+def _shape(args):
+
+    return {key: int(args[f'--{key}']) for key in SHAPE}
+
+
+def _service(index, shape):
+
+    name = f"svc{index:05d}"
+    configmap_name = f"{name}-env"
+    env = [{'name': f"VAR_{var}", 'value': f"value-{index}-{var}"} for var in range(shape['env'])]
+    env += [{'name': f"CM_{key}", 'valueFrom': {'configMapKeyRef': {'name': configmap_name, 'key': f"CM_{key}"}}}
+            for key in range(shape['configmap-keys'])]
+    container = {
+        'name': name,
+        'image': f"registry.example.com/team/{name}:1.{index % 10}",
+        'env': env,
+        'ports': [{'containerPort': 8000 + port} for port in range(shape['ports'])],
+        'resources': {'limits': {'cpu': f"{250 * (1 + index % 8)}m", 'memory': str(1048576 * (1 + index % 4))}},
+        'volumeMounts': [{'name': f"{name}-data{volume}", 'mountPath': f"/data/{volume}"}
+                         for volume in range(shape['volumes'])],
+    }
+    deployment = {
+        'apiVersion': "apps/v1",
+        'kind': "Deployment",
+        'metadata': {'name': name, 'labels': {'io.kompose.service': name}},
+        'spec': {'replicas': 1, 'template': {'spec': {'containers': [container], 'restartPolicy': "Always"}}},
+    }
+    service = {
+        'apiVersion': "v1",
+        'kind': "Service",
+        'metadata': {'name': name},
+        'spec': {'ports': [{'name': str(9000 + port), 'port': 9000 + port, 'targetPort': 8000 + port}
+                           for port in range(shape['ports'])]},
+    }
+    configmap = {
+        'apiVersion': "v1",
+        'kind': "ConfigMap",
+        'metadata': {'name': configmap_name},
+        'data': {f"CM_{key}": f"cm-{index}-{key}" for key in range(shape['configmap-keys'])},
+    }
+    return deployment, service, configmap if shape['configmap-keys'] else None
+
+
+def _compose(shape):
+
+    services = {}
+    for index in range(shape['services']):
+        name = f"svc{index:05d}"
+        services[name] = {
+            'image': f"registry.example.com/team/{name}:1.{index % 10}",
+            'ports': [f"{9000 + port}:{8000 + port}" for port in range(shape['ports'])],
+            'environment': [f"VAR_{var}=value-{index}-{var}" for var in range(shape['env'])],
+            'volumes': [f"{name}-data{volume}:/data/{volume}" for volume in range(shape['volumes'])],
+        }
+    volumes = {f"svc{index:05d}-data{volume}": {}
+               for index in range(shape['services']) for volume in range(shape['volumes'])}
+    return {'version': "3", 'services': services, 'volumes': volumes}
+
+
+def generate(out_dir, shape, output_format="k8s"):
+    """
+    Write the synthetic inputs, returns the file names
+    """
+    import yaml
+    os.makedirs(out_dir, exist_ok=True)
+    if output_format == 'compose':
+        file_name = os.path.join(out_dir, "docker-compose.yaml")
+        with open(file_name, 'w', encoding="utf-8") as f:
+            yaml.safe_dump(_compose(shape), f, sort_keys=False)
+        return [file_name]
+
+    # one multi-document stream per 100 services, like kompose --stdout or kubectl get -o yaml
+    file_names = []
+    for start in range(0, shape['services'], 100):
+        file_name = os.path.join(out_dir, f"services-{start // 100:04d}.yaml")
+        documents = []
+        for index in range(start, min(start + 100, shape['services'])):
+            documents.extend(doc for doc in _service(index, shape) if doc)
+        with open(file_name, 'w', encoding="utf-8") as f:
+            yaml.dump_all(documents, f, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper), sort_keys=False)
+        file_names.append(file_name)
+    return file_names
+
+
+def _convert(file_names):
+
+    count = 0
+    for deployment_data, service_data, config_map in ztool.route(
+            doc for file_name, doc in ztool.load_documents(file_names)):
+        ztool.convertToApp(deployment_data, service_data, config_map)
+        json.dumps(ztool.appPayload)
+        count += 1
+    return count
+
+
+def run(shape, repeat=3):
+    """
+    Measure the conversion of one generated input set, returns the report
+    """
+    import tracemalloc
+    with tempfile.TemporaryDirectory(prefix="ztool-bench-") as work_dir:
+        file_names = generate(work_dir, shape)
+        input_bytes = sum(os.path.getsize(file_name) for file_name in file_names)
+
+        # the fastest pass is the least disturbed one
+        best = None
+        for _ in range(repeat):
+            profiling.phases.clear()
+            start = time.perf_counter()
+            apps = _convert(file_names)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best[0]:
+                best = (elapsed, {name: {'seconds': round(total, 6), 'calls': calls}
+                                  for name, (total, calls) in profiling.phases.items()})
+
+        # separate pass, tracemalloc slows everything down
+        tracemalloc.start()
+        _convert(file_names)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    elapsed, phases = best
+    return {
+        'shape': shape,
+        'python': platform.python_version(),
+        'yaml_loader': ztool.yaml_loader().__name__,
+        'apps': apps,
+        'input_bytes': input_bytes,
+        'seconds': round(elapsed, 6),
+        'apps_per_second': round(apps / elapsed, 2),
+        'peak_bytes': peak,
+        'phases': dict(sorted(phases.items(), key=lambda item: -item[1]['seconds'])),
+    }
+
+
+def compare(report, baseline, tolerance=10.0):
+    """
+    Metrics worse than the baseline by more than tolerance percent, [(metric, baseline, now, change %)]
+    """
+    if report['shape'] != baseline['shape']:
+        raise ValueError(f"baseline shape {baseline['shape']} differs from {report['shape']}")
+    values = [(metric, baseline[metric], report[metric], higher) for metric, higher in METRICS.items()]
+    values += [(f"phase {name}", entry['seconds'], report['phases'].get(name, {}).get('seconds', 0.0), False)
+               for name, entry in baseline['phases'].items()]
+    regressions = []
+    for metric, before, now, higher in values:
+        if not before:
+            continue
+        change = 100.0 * (now - before) / before
+        if (-change if higher else change) > tolerance:
+            regressions.append((metric, before, now, round(change, 1)))
+    return regressions
+
+
+def main(argv=None):
+
+    from docopt import docopt
+    args = docopt(usage, sys.argv[1:] if argv is None else argv)
+    shape = _shape(args)
+
+    if args['generate']:
+        file_names = generate(args['<out-dir>'], shape, args['--format'] or "k8s")
+        print("\n".join(file_names))
+        return 0
+
+    report = run(shape, int(args['--repeat'] or 3))
+    print(f"{report['apps']} apps in {report['seconds']:.3f}s, {report['apps_per_second']} apps/s, "
+          f"peak {report['peak_bytes'] / 1048576:.1f} MiB ({report['yaml_loader']})")
+    for name, entry in report['phases'].items():
+        share = 100.0 * entry['seconds'] / report['seconds']
+        print(f"  {name:<24} {entry['seconds']:9.4f}s {share:5.1f}% {entry['calls']:>8} calls")
+    if args['--report']:
+        with open(args['--report'], 'w', encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args['--baseline']:
+        with open(args['--baseline'], encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, float(args['--tolerance'] or 10))
+        for metric, before, now, change in regressions:
+            print(f"REGRESSION {metric}: {before} -> {now} ({change:+.1f}%)")
+        if regressions:
+            return 1
+        print("no regression against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
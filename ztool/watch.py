@@ -0,0 +1,231 @@
+"""
+    Watch mode for ztool.
+
+    Watches a directory of docker compose files and the Deployment, Service
+    and ConfigMap files kompose generates from them, and keeps one edge-app
+    manifest (<deployment name>.json) per Deployment up to date:
+
+      - a changed compose file is converted again with kompose (in the
+        watched directory, so its output is picked up as a change as well)
+      - only changed YAML files are parsed again, the parsed documents of
+        every file stay in memory between edits
+      - a manifest section (configuration, images, resources, interfaces)
+        is rebuilt only when what it is built from changed
+
+    Changes are read with inotify on Linux, other systems fall back to
+    polling the modification times.
+"""
+
+import copy
+import json
+import os
+import struct
+import sys
+import time
+
+from profiling import phase
+from ztool import SECTIONS, appPayload, _app_inputs, _build_section, _section_inputs, read_documents, route
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+# IN_MODIFY also sees writes to files that are kept open, the burst of events
+# one save produces is merged by SETTLE
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+YAML_SUFFIXES = ('.yaml', '.yml')
+# editors save in bursts, changes are collected this long before a rebuild
+SETTLE = 0.2
+
+
+def _is_compose(file_name):
+
+    return os.path.basename(file_name).startswith(('docker-compose', 'compose'))
+
+
+class _inotify(object):
+
+    def __init__(self, directory):
+
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {directory} failed")
+        self.directory = directory
+
+    def changes(self, timeout):
+        """
+        Names of the files changed within timeout seconds, empty when nothing changed
+        """
+        import select
+        names = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            data = os.read(self.fd, 65536)
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if name:
+                    names.add(os.path.join(self.directory, os.fsdecode(name)))
+            ready, _, _ = select.select([self.fd], [], [], SETTLE)
+        return names
+
+
+class _poller(object):
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        self.mtimes = self._scan()
+
+    def _scan(self):
+
+        mtimes = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    mtimes[entry.path] = entry.stat().st_mtime_ns
+        return mtimes
+
+    def changes(self, timeout):
+
+        time.sleep(timeout)
+        mtimes = self._scan()
+        names = {path for path, mtime in mtimes.items() if self.mtimes.get(path) != mtime}
+        names |= set(self.mtimes) - set(mtimes)
+        self.mtimes = mtimes
+        return names
+
+
+class watcher(object):
+
+    def __init__(self, directory, out_dir=None):
+
+        self.directory = directory
+        self.out_dir = out_dir or directory
+        # relative file variables name files next to the watched files
+        self.base_dir = os.path.abspath(directory)
+        # path: (mtime, [documents])
+        self.documents = {}
+        # deployment name: {section: (inputs, built section)}
+        self.apps = {}
+
+    def _load(self, path):
+
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self.documents.pop(path, None)
+            return
+        cached = self.documents.get(path)
+        if cached and cached[0] == mtime:
+            return
+        try:
+            documents = read_documents(path)
+        except Exception as read_error:
+            # half written file, the next save triggers another load
+            print(f"read yaml {path} failed {read_error}")
+            return
+        self.documents[path] = (mtime, documents)
+
+    def _kompose(self, path):
+
+        import subprocess
+        print(f"{os.path.basename(path)} changed, running kompose")
+        with phase('kompose'):
+            proc = subprocess.run(["kompose", "--file", os.path.abspath(path), "convert"],
+                                  cwd=self.directory, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"convert {path} failed {proc.stderr.strip()}")
+
+    def rebuild(self):
+        """
+        Bring every manifest up to date, returns {workload name: [rebuilt sections]}
+        """
+        rebuilt = {}
+        names = set()
+        for deployment, service, configmap in route(doc for mtime, documents in self.documents.values()
+                                                    for doc in documents):
+            name = deployment['metadata']['name']
+            names.add(name)
+            container_data, service_data, configmap_data = _app_inputs(deployment, service, configmap)
+
+            app = self.apps.setdefault(name, {})
+            inputs = _section_inputs(container_data, service_data, configmap_data)
+            changed = [section for section in SECTIONS
+                       if section not in app or app[section][0] != inputs[section]]
+            for section in changed:
+                # inputs are copied, the next parse of the file must not alias them
+                app[section] = (copy.deepcopy(inputs[section]),
+                                _build_section(section, container_data, service_data, configmap_data,
+                                               self.base_dir))
+            if changed or app.get('name') != container_data['name']:
+                app['name'] = container_data['name']
+                self._write(name, app)
+                rebuilt[name] = changed
+        for name in set(self.apps) - names:
+            del self.apps[name]
+        return rebuilt
+
+    def _write(self, name, app):
+
+        payload = copy.deepcopy(appPayload)
+        payload['name'] = app['name']
+        for section in SECTIONS:
+            payload[section] = app[section][1]
+        file_name = os.path.join(self.out_dir, f"{name}.json")
+        with open(file_name + ".tmp", 'w', encoding="utf-8") as f:
+            json.dump(payload, f, indent=3)
+        os.replace(file_name + ".tmp", file_name)
+
+    def update(self, paths):
+        """
+        Handle changed files, returns what rebuild() returns
+        """
+        for path in sorted(paths):
+            if not path.endswith(YAML_SUFFIXES):
+                continue
+            if _is_compose(path):
+                if os.path.exists(path):
+                    self._kompose(path)
+                continue
+            self._load(path)
+        return self.rebuild()
+
+    def run(self, interval=1.0):
+
+        try:
+            events = _inotify(self.directory)
+        except (OSError, AttributeError) as inotify_error:
+            print(f"inotify not available ({inotify_error}), polling every {interval}s")
+            events = _poller(self.directory)
+
+        paths = [entry.path for entry in os.scandir(self.directory)
+                 if entry.is_file() and entry.name.endswith(YAML_SUFFIXES) and not _is_compose(entry.path)]
+        self._report(self.update(paths))
+        print(f"watching {self.directory}, Ctrl-C to stop")
+        try:
+            while True:
+                paths = events.changes(interval)
+                if paths:
+                    self._report(self.update(paths))
+        except KeyboardInterrupt:
+            return 0
+
+    def _report(self, rebuilt):
+
+        for name, sections in rebuilt.items():
+            print(f"{name}.json: rebuilt {', '.join(sections) or 'name'}")
+        sys.stdout.flush()
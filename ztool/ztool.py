@@ -3,17 +3,30 @@
 """
 
 import json
+import os
 import sys
-import subprocess
 import base64
-import yaml
-from docopt import docopt
+
+from profiling import phase, timed
 
 usage = '''
 Tool to create zedCloud edge-app from docker-compose-resource.yaml
 Usage:
     ztool.py convert <docker-compose-resource.yaml>
     ztool.py convertToApp --pod-definition=<deployment.yaml> [--service-definition=<service.yaml>] [--configmap-definition=<configmap.yaml>]
+    ztool.py convertAll <file.yaml>... [--out=<out-dir>]
+    ztool.py watch <dir> [--out=<out-dir>] [--interval=<seconds>]
+
+convertAll reads every document of the given files (multi-document streams and kubectl Lists
+included) and writes one <deployment>.json edge-app per Deployment to --out (default .),
+with the Service of the same name and the ConfigMap the container refers to.
+watch keeps <deployment>.json edge-apps in --out (default <dir>) up to date while the compose,
+deployment, service and configmap files in <dir> are edited, see watch.py.
+
+--output=ndjson prints the edge-app as one compact JSON line instead of indented JSON.
+--profile=sample|cpu|mem[:<prefix>] on any command writes a stack sample, cProfile or
+allocation profile and the time spent in YAML parsing, kompose and each builder,
+see profiling.py.
 
 '''
 
@@ -92,22 +105,131 @@ def cpu_unit(cpu):
     return config_cpu
 
 
+_loader = None
+
+
+def yaml_loader():
+    """
+    The libyaml based loader when PyYAML was built with it, the pure Python one otherwise
+    """
+    global _loader
+    if _loader is None:
+        import yaml
+        _loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return _loader
+
+
+def read_documents(file_name):
+    """
+    Every document of a YAML stream, the items of a kubectl List are returned as documents
+    """
+    import yaml
+    documents = []
+    with open(file_name, encoding="utf-8") as f_input, phase('yaml'):
+        for doc in yaml.load_all(f_input, Loader=yaml_loader()):
+            if not isinstance(doc, dict):
+                continue
+            if doc.get('kind') == 'List':
+                documents.extend(item for item in doc.get('items') or [] if isinstance(item, dict))
+            else:
+                documents.append(doc)
+    return documents
+
+
+def load_documents(file_names):
+    """
+    Stream (file name, document) over many files, unreadable files are reported and skipped
+    """
+    for file_name in file_names:
+        try:
+            documents = read_documents(file_name)
+        except Exception as read_error:
+            print(f"read yaml {file_name} failed {read_error}", file=sys.stderr)
+            continue
+        for doc in documents:
+            yield file_name, doc
+
+
 def convert_to_yaml(deployment_file):
     """
-    Method to convert deployment template to YAML object
+    Method to convert deployment template to YAML object, {} when it cannot be read
     """
     try:
-        with open(deployment_file, encoding="utf-8") as f_input:
-            data = yaml.safe_load(f_input)
+        documents = read_documents(deployment_file)
     except Exception as read_error:
-        print(f"read yaml {deployment_file} failed {read_error}")
-    return data
+        print(f"read yaml {deployment_file} failed {read_error}", file=sys.stderr)
+        return {}
+    return documents[0] if documents else {}
+
+
+def _configmap_names(container_data):
+
+    names = []
+    for item in container_data.get('env') or []:
+        ref = (item.get('valueFrom') or {}).get('configMapKeyRef')
+        if ref and ref['name'] not in names:
+            names.append(ref['name'])
+    for item in container_data.get('envFrom') or []:
+        if item.get('configMapRef') and item['configMapRef']['name'] not in names:
+            names.append(item['configMapRef']['name'])
+    return names
+
+
+def _containers(doc):
+
+    return (((doc.get('spec') or {}).get('template') or {}).get('spec') or {}).get('containers')
+
+
+def route(documents):
+    """
+    Group workload, Service and ConfigMap documents into convertToApp inputs,
+    returns [(workload, service, configmap)]. A workload is any document with a pod
+    template (Deployment, StatefulSet, ...), the Service of the same name and the
+    ConfigMap its container refers to go with it.
+    """
+    workloads, services, configmaps = {}, {}, {}
+    for doc in documents:
+        name = (doc.get('metadata') or {}).get('name')
+        if not name:
+            continue
+        if doc.get('kind') == 'Service':
+            services[name] = doc
+        elif doc.get('kind') == 'ConfigMap':
+            configmaps[name] = doc
+        elif _containers(doc):
+            workloads[name] = doc
+
+    apps = []
+    for name, workload in workloads.items():
+        configmap = {}
+        for configmap_name in _configmap_names(_containers(workload)[0]):
+            if configmap_name in configmaps:
+                configmap = configmaps[configmap_name]
+                break
+        apps.append((workload, services.get(name, {}), configmap))
+    return apps
+
+
+def _file_variable(value, base_dir=None):
+    """
+    Base64 content of the file a file variable names, None when there is no such file.
+    A relative name is resolved against base_dir, the directory of the input file.
+    """
+    file_name = value.replace("\\", os.sep)
+    if base_dir and not os.path.isabs(file_name):
+        file_name = os.path.join(base_dir, file_name)
+    if not os.path.isfile(file_name):
+        return None
+    with phase('file_variables'), open(file_name, 'rb') as f_input:
+        return base64.b64encode(f_input.read()).decode()
 
 
-def _build_custom_config(env_list):
+@timed('_build_custom_config')
+def _build_custom_config(env_list, base_dir=None):
 
-    template_str = ""
+    template_parts = []
     delimiter = "###"
+    variables = []
     data = {
         "customConfig": {
             "name": "Custom_config",
@@ -119,8 +241,7 @@ def _build_custom_config(env_list):
             "variableGroups": [
                 {
                     "name": "Default grp 1",
-                    "variables": [
-                    ],
+                    "variables": variables,
                     "required": True,
                     "condition": None
                 }
@@ -128,41 +249,48 @@ def _build_custom_config(env_list):
         }
     }
     for item in env_list:
-        config_data = {}
-        temp_string = f"{item['name']}={delimiter}{item['name']}{delimiter}\n"
-        template_str = template_str + temp_string
-        config_data['name'] = item['name']
-        config_data['label'] = item['name']
-        config_data['required'] = True
-        config_data['default'] = item['value']
-        config_data['value'] = ""
-        config_data['maxLength'] = ""
-        config_data['type'] = ""
-        config_data['options'] = []
-        config_data['encode'] = "FILE_ENCODING_UNSPECIFIED"
-
-        if "\\" in item['value']:
+        # valueFrom entries have no literal value
+        value = item.get('value')
+        value = "" if value is None else str(value)
+        template_parts.append(f"{item['name']}={delimiter}{item['name']}{delimiter}\n")
+        config_data = {
+            'name': item['name'],
+            'label': item['name'],
+            'required': True,
+            'default': value,
+            'value': "",
+            'maxLength': "",
+            'type': "",
+            'options': [],
+            'encode': "FILE_ENCODING_UNSPECIFIED",
+        }
+
+        if "\\" in value:
             config_data['format'] = "VARIABLE_FORMAT_FILE"
             config_data['encode'] = "FILE_ENCODING_BASE64"
+            content = _file_variable(value, base_dir)
+            if content is not None:
+                config_data['default'] = content
         elif 'password' in item['name']:
             config_data['format'] = "VARIABLE_FORMAT_PASSWORD"
         else:
             config_data['format'] = "VARIABLE_FORMAT_TEXT"
 
-        data['customConfig']['variableGroups'][0]['variables'].append(config_data)
+        variables.append(config_data)
 
-    data['customConfig']['template'] = base64.b64encode(template_str.encode()).decode()
+    data['customConfig']['template'] = base64.b64encode("".join(template_parts).encode()).decode()
     return data
 
 
+@timed('_build_image')
 def _build_image(image):
 
     images = []
-    image_detail = image.split('/')
-    image_name = image_detail[-1]
     if isinstance(image, str):
+        # the full reference, registry and namespace included, publish
+        # creates the controller image from it
         data = {
-            'imagename': image_name,
+            'imagename': image,
             'maxsize': "0",
             'preserve': False,
             "target": "",
@@ -177,6 +305,7 @@ def _build_image(image):
     return images
 
 
+@timed('_build_resources')
 def _build_resources(resource_data):
 
     sys_resources = [
@@ -207,6 +336,7 @@ def _build_resources(resource_data):
     return sys_resources
 
 
+@timed('_build_outbound')
 def _build_outbound():
 
     rules = ['0.0.0.0/0', '*']
@@ -228,6 +358,7 @@ def _build_outbound():
     return out_bound
 
 
+@timed('_build_interfaces')
 def _build_interfaces(ports):
 
     interfaces = {'name': "eth0", 'directattach': False, 'acls': []}
@@ -267,8 +398,10 @@ def _build_interfaces(ports):
     return interfaces
 
 
+@timed('_build_volumes')
 def _build_volumes(volumes):
 
+    images = []
     for vol in volumes:
         data = {
             'imagename': '',
@@ -282,22 +415,23 @@ def _build_volumes(volumes):
             "cleartext": False,
             "mountpath": vol['mountPath']
         }
-        appPayload['images'].append(data)
+        images.append(data)
+    return images
 
-def _build_configmap(env_configmap):
+@timed('_build_configmap')
+def _build_configmap(env_configmap, base_dir=None):
 
     configmap_list = []
     for key, value in env_configmap.items():
         temp = {'name': key, 'value': value}
         configmap_list.append(temp)
 
-    return _build_custom_config(configmap_list)
+    return _build_custom_config(configmap_list, base_dir)
 
-def convertToApp(deployment_data, service_template, configmap_template):
+def _app_inputs(deployment_data, service_template, configmap_template):
     """
-    Method to convert pod definition to zededa container instance definition
+    Container, service ports and configmap data of the pod definition
     """
-
     container_data = deployment_data['spec']['template']['spec']['containers'][0]
     if 'spec' in service_template.keys():
         service_data = service_template['spec']['ports']
@@ -308,31 +442,72 @@ def convertToApp(deployment_data, service_template, configmap_template):
         configmap_data = configmap_template['data']
     else:
         configmap_data = {}
+    return container_data, service_data, configmap_data
+
+
+def _section_inputs(container_data, service_data, configmap_data):
+    """
+    What each section of the edge-app is built from, watch mode rebuilds a section
+    only when its inputs changed
+    """
+    return {
+        'configuration': (container_data.get('env'), configmap_data),
+        'images': (container_data.get('image'), container_data.get('volumeMounts')),
+        'resources': container_data.get('resources'),
+        'interfaces': (container_data.get('ports'), service_data),
+    }
+
+
+def _build_section(section, container_data, service_data, configmap_data, base_dir=None):
+
+    if section == 'configuration':
+        if 'env' in container_data.keys() and configmap_data == {}:
+            return _build_custom_config(container_data['env'], base_dir)
+        if 'env' in container_data.keys() and configmap_data != {}:
+            return _build_configmap(configmap_data, base_dir)
+        return {}
+    if section == 'images':
+        images = []
+        if 'image' in container_data.keys():
+            images = _build_image(container_data['image'])
+        if 'volumeMounts' in container_data.keys():
+            images += _build_volumes(container_data['volumeMounts'])
+        return images
+    if section == 'resources':
+        if 'resources' in container_data.keys() and container_data['resources'] != {}:
+            return _build_resources(container_data['resources'])
+        return resources
+    if section == 'interfaces':
+        if 'ports' in container_data.keys() and service_data != {}:
+            return [_build_interfaces(service_data)]
+        return []
+    raise ValueError(f"unknown edge-app section {section}")
+
+
+SECTIONS = ('configuration', 'images', 'resources', 'interfaces')
+
+
+def convertToApp(deployment_data, service_template, configmap_template, base_dir=None):
+    """
+    Method to convert pod definition to zededa container instance definition,
+    relative file variables are read from base_dir
+    """
+    container_data, service_data, configmap_data = _app_inputs(
+        deployment_data, service_template, configmap_template)
 
     appPayload['name'] = container_data['name']
-    if 'env' in container_data.keys() and configmap_data == {}:
-        appPayload['configuration'] = _build_custom_config(container_data['env'])
-    if 'env' in container_data.keys() and configmap_data != {}:
-        appPayload['configuration'] = _build_configmap(configmap_data)
-    if 'image' in container_data.keys():
-        appPayload['images'] = _build_image(container_data['image'])
-    if 'resources' in container_data.keys() and container_data['resources'] != {}:
-        appPayload['resources'] = _build_resources(container_data['resources'])
-    else:
-        appPayload['resources'] = resources
-    if 'ports' in container_data.keys() and service_data != {}:
-        appPayload['interfaces'].append(_build_interfaces(service_data))
-    if 'volumeMounts' in container_data.keys():
-        _build_volumes(container_data['volumeMounts'])
+    for section in SECTIONS:
+        appPayload[section] = _build_section(section, container_data, service_data, configmap_data, base_dir)
 
 
 def convertToDeployment(**kwargs):
     """
     Method convert docker compose to kubernetes pod definition
     """
+    import subprocess
     compose_file = kwargs['<docker-compose-resource.yaml>']
     cmd = f"kompose --file {compose_file} convert"
-    with subprocess.Popen(cmd.split(" "), stdout=subprocess.PIPE) as proc:
+    with phase('kompose'), subprocess.Popen(cmd.split(" "), stdout=subprocess.PIPE) as proc:
         output, error = proc.communicate()
 
     if error:
@@ -341,33 +516,82 @@ def convertToDeployment(**kwargs):
     return 0
 
 
-def main():
+def convertAll(file_names, out_dir=".", compact=False):
+    """
+    Convert every Deployment found in the files, one <name>.json per Deployment
+    """
+    count = 0
+    # directory of the file each document came from
+    sources = {}
+
+    def documents():
+        for file_name, doc in load_documents(file_names):
+            sources[id(doc)] = os.path.dirname(os.path.abspath(file_name))
+            yield doc
+
+    for deployment_data, service_data, config_map in route(documents()):
+        convertToApp(deployment_data, service_data, config_map, sources[id(deployment_data)])
+        file_name = os.path.join(out_dir, f"{deployment_data['metadata']['name']}.json")
+        with open(file_name, 'w', encoding="utf-8") as f_output:
+            if compact:
+                json.dump(appPayload, f_output, separators=(',', ':'))
+            else:
+                json.dump(appPayload, f_output, indent=3)
+        count += 1
+    print(f"{count} edge-apps written to {out_dir}")
+    return 0 if count else 1
+
+
+def main(argv=None):
     """
     Main Method
     """
+    from profiling import pop_profile_option, run_profiled
+    profile, argv = pop_profile_option(sys.argv[1:] if argv is None else argv)
+    if profile:
+        return run_profiled(profile, main, argv)
+    compact = '--output=ndjson' in argv
+    argv = [arg for arg in argv if arg != '--output=ndjson']
+
+    from docopt import docopt
     try:
-        args = docopt(usage)
+        args = docopt(usage, argv)
     except Exception as docopt_error:
         print(docopt_error)
 
+    if args['watch']:
+        from watch import watcher
+        return watcher(args['<dir>'], args['--out']).run(float(args['--interval'] or 1.0))
     if args['convert']:
         status = convertToDeployment(**args)
         if status != 0:
             print("Conversion failed")
             sys.exit(1)
     elif args['convertToApp']:
-        deployment_data = convert_to_yaml(args['--pod-definition'])
+        apps = route(doc for file_name, doc in load_documents([args['--pod-definition']]))
+        if not apps:
+            print(f"no workload in {args['--pod-definition']}", file=sys.stderr)
+            sys.exit(1)
+        # a single stream may carry the Service and ConfigMap as well
+        deployment_data, service_data, config_map = apps[0]
+        if len(apps) > 1:
+            ignored = ", ".join(app[0]['metadata']['name'] for app in apps[1:])
+            print(f"{args['--pod-definition']} holds {len(apps)} workloads, converting "
+                  f"{deployment_data['metadata']['name']} only, ignored {ignored}; "
+                  f"convertAll converts every one", file=sys.stderr)
         if args['--service-definition']:
             service_data = convert_to_yaml(args['--service-definition'])
-        else:
-            service_data = {}
         if args['--configmap-definition']:
             config_map = convert_to_yaml(args['--configmap-definition'])
-        else:
-            config_map = {}
 
-        convertToApp(deployment_data, service_data, config_map)
-        print(json.dumps(appPayload, indent=3))
+        convertToApp(deployment_data, service_data, config_map,
+                     os.path.dirname(os.path.abspath(args['--pod-definition'])))
+        if compact:
+            print(json.dumps(appPayload, separators=(',', ':')))
+        else:
+            print(json.dumps(appPayload, indent=3))
+    elif args['convertAll']:
+        return convertAll(args['<file.yaml>'], args['--out'] or ".", compact)
 
 
 if __name__ == '__main__':